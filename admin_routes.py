@@ -1,8 +1,24 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_user, logout_user, current_user
 from models import db, User, Store, Product, Service, Order, Advertisement, Job
-from auth import admin_required, is_admin_logged_in, authenticate_user
-from sqlalchemy import func, desc
+from auth import admin_required, is_admin_logged_in, throttled_authenticate
+from login_limits import LoginThrottled
+from stats import get_dashboard_stats, DashboardStats
+from serializers import list_loaders, serialize
+from pagination import paginate_list
+from search import search_catalog, SEARCHABLE
+from exports import ExportFilters, export_response
+from bulk_import import IMPORTABLE, import_catalog, read_sheet
+from rollups import CHART_RANGES, order_timeseries
+from feed import feed_response
+from counters import GLOBAL_SCOPE
+from conditional import conditional, scope
+from slow_queries import slow_query_log
+from fragments import render_page, wants_fragment
+import cascades
+import tasks
+from models import BackgroundTask, StatsCounter
+from sqlalchemy import desc
 import logging
 from datetime import datetime
 
@@ -22,8 +38,12 @@ def login():
             flash('يرجى إدخال اسم المستخدم وكلمة المرور', 'error')
             return render_template('admin/login.html')
         
-        # Authenticate with database
-        user = authenticate_user(username, password, 'admin')
+        # Authenticate with database, refusing floods before any password hashing
+        try:
+            user = throttled_authenticate(username, password, 'admin')
+        except LoginThrottled as e:
+            flash(e.message, 'error')
+            return render_template('admin/login.html'), 429, {'Retry-After': str(e.retry_after)}
         
         if not user:
             flash('اسم المستخدم أو كلمة المرور غير صحيحة', 'error')
@@ -47,22 +67,14 @@ def logout():
 
 @admin_bp.route('/dashboard')
 @admin_required
+@conditional(lambda: [scope(StatsCounter, StatsCounter.merchant_id == GLOBAL_SCOPE), scope(Order), scope(Product)])
 def dashboard():
     """Admin dashboard with statistics"""
     try:
         # Get statistics from database
-        stats = {
-            'total_users': User.query.filter_by(role='merchant').count(),
-            'total_admins': User.query.filter_by(role='admin').count(),
-            'total_stores': Store.query.count(),
-            'total_products': Product.query.count(),
-            'total_services': Service.query.count(),
-            'total_orders': Order.query.count(),
-            'total_ads': Advertisement.query.count(),
-            'total_jobs': Job.query.count(),
-            'pending_orders': Order.query.filter_by(status='pending').count(),
-            'active_stores': Store.query.filter_by(is_active=True).count(),
-        }
+        stats = get_dashboard_stats().to_dict()
+        if wants_fragment():
+            return render_template('admin/_dashboard_stats.html', stats=stats)
         
         # Get recent activity
         recent_orders = Order.query.order_by(desc(Order.created_at)).limit(5).all()
@@ -72,43 +84,65 @@ def dashboard():
                              stats=stats, 
                              recent_orders=recent_orders,
                              recent_products=recent_products,
+                             chart_ranges=CHART_RANGES,
                              now=datetime.now())
     except Exception as e:
         flash('فشل في تحميل الإحصائيات', 'error')
         logging.error(f"Dashboard stats error: {e}")
         return render_template('admin/dashboard.html', 
-                             stats={'total_users': 0, 'total_stores': 0, 'total_products': 0, 'total_orders': 0, 'pending_orders': 0}, 
+                             stats=DashboardStats().to_dict(), 
                              recent_orders=[], 
-                             recent_products=[])
+                             recent_products=[],
+                             chart_ranges=CHART_RANGES)
+
+@admin_bp.route('/stats/orders')
+@admin_required
+def order_stats():
+    """Daily platform orders and revenue from the rollup table"""
+    days = request.args.get('days', CHART_RANGES[1], type=int)
+    if days not in CHART_RANGES:
+        days = CHART_RANGES[1]
+    
+    try:
+        # Refreshed by a background task; the chart shows the rollups as they stand
+        tasks.refresh_rollups_if_stale()
+        return jsonify({'days': days, 'series': order_timeseries(days)})
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Order stats error: {e}")
+        return jsonify({'error': 'فشل في تحميل الإحصائيات', 'days': days, 'series': []}), 500
+
+@admin_bp.route('/live')
+@admin_required
+def live_feed():
+    """Server-Sent Events feed of platform orders and counters"""
+    return feed_response(
+        db.engine, GLOBAL_SCOPE, sees_all=True,
+        heartbeat=current_app.config['FEED_HEARTBEAT'],
+        max_seconds=current_app.config['FEED_MAX_STREAM_SECONDS']
+    )
 
 @admin_bp.route('/users')
 @admin_required
+@conditional(lambda: [scope(User)])
 def users():
     """Users management page"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
     try:
         # Get users with pagination
-        users_pagination = User.query.filter_by(role='merchant').paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        users_page = paginate_list(User.query.filter_by(role='merchant'), User, per_page)
         
-        users_list = [user.to_dict() for user in users_pagination.items]
+        users_list = serialize(users_page.items)
         
-        return render_template('admin/users.html', 
+        return render_page('admin/users.html', 'admin/_users_list.html', 
                              users=users_list,
-                             current_page=page,
-                             total_pages=users_pagination.pages,
-                             total_users=users_pagination.total,
-                             has_prev=users_pagination.has_prev,
-                             has_next=users_pagination.has_next,
-                             prev_num=users_pagination.prev_num,
-                             next_num=users_pagination.next_num)
+                             total_users=users_page.total,
+                             **users_page.template_args())
     except Exception as e:
         flash('فشل في تحميل المستخدمين', 'error')
         logging.error(f"Users page error: {e}")
-        return render_template('admin/users.html', 
+        return render_page('admin/users.html', 'admin/_users_list.html', 
                              users=[], current_page=1, total_pages=0, total_users=0)
 
 @admin_bp.route('/users/<int:user_id>/toggle-status', methods=['POST'])
@@ -143,15 +177,11 @@ def delete_user(user_id):
             flash('لا يمكن حذف هذا المستخدم', 'error')
             return redirect(url_for('admin.users'))
         
-        # Delete related stores, products, orders
-        stores = Store.query.filter_by(merchant_id=user_id).all()
-        for store in stores:
-            db.session.delete(store)
-        
-        db.session.delete(user)
+        # Delete related stores, products, services and orders in the background
+        queued = tasks.enqueue('delete_merchant', {'user_id': user.id})
         db.session.commit()
         
-        flash('تم حذف المستخدم وجميع بياناته بنجاح', 'success')
+        flash(f'تمت جدولة حذف المستخدم وجميع بياناته (المهمة #{queued.id})', 'success')
     except Exception as e:
         db.session.rollback()
         flash('فشل في حذف المستخدم', 'error')
@@ -161,32 +191,25 @@ def delete_user(user_id):
 
 @admin_bp.route('/stores')
 @admin_required
+@conditional(lambda: [scope(Store), scope(User)])
 def stores():
     """Stores management page"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
     try:
         # Get stores with pagination
-        stores_pagination = Store.query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        stores_page = paginate_list(Store.query.options(*list_loaders(Store)), Store, per_page)
         
-        stores_list = [store.to_dict() for store in stores_pagination.items]
+        stores_list = serialize(stores_page.items)
         
-        return render_template('admin/stores.html',
+        return render_page('admin/stores.html', 'admin/_stores_list.html',
                              stores=stores_list,
-                             current_page=page,
-                             total_pages=stores_pagination.pages,
-                             total_stores=stores_pagination.total,
-                             has_prev=stores_pagination.has_prev,
-                             has_next=stores_pagination.has_next,
-                             prev_num=stores_pagination.prev_num,
-                             next_num=stores_pagination.next_num)
+                             total_stores=stores_page.total,
+                             **stores_page.template_args())
     except Exception as e:
         flash('فشل في تحميل المتاجر', 'error')
         logging.error(f"Stores page error: {e}")
-        return render_template('admin/stores.html', 
+        return render_page('admin/stores.html', 'admin/_stores_list.html', 
                              stores=[], current_page=1, total_pages=0, total_stores=0)
 
 @admin_bp.route('/stores/<int:store_id>/delete', methods=['POST'])
@@ -196,19 +219,11 @@ def delete_store(store_id):
     try:
         store = Store.query.get_or_404(store_id)
         
-        # Delete related products and services
-        products = Product.query.filter_by(store_id=store_id).all()
-        services = Service.query.filter_by(store_id=store_id).all()
-        
-        for product in products:
-            db.session.delete(product)
-        for service in services:
-            db.session.delete(service)
-        
-        db.session.delete(store)
+        # Delete related products, services and orders in the background
+        queued = tasks.enqueue('delete_store', {'store_id': store.id})
         db.session.commit()
         
-        flash('تم حذف المتجر وجميع منتجاته بنجاح', 'success')
+        flash(f'تمت جدولة حذف المتجر وجميع منتجاته (المهمة #{queued.id})', 'success')
     except Exception as e:
         db.session.rollback()
         flash('فشل في حذف المتجر', 'error')
@@ -218,32 +233,25 @@ def delete_store(store_id):
 
 @admin_bp.route('/products')
 @admin_required
+@conditional(lambda: [scope(Product), scope(Store), scope(User)])
 def products():
     """Products management page"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
     try:
         # Get products with pagination
-        products_pagination = Product.query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        products_page = paginate_list(Product.query.options(*list_loaders(Product)), Product, per_page)
         
-        products_list = [product.to_dict() for product in products_pagination.items]
+        products_list = serialize(products_page.items)
         
-        return render_template('admin/products.html',
+        return render_page('admin/products.html', 'admin/_products_list.html',
                              products=products_list,
-                             current_page=page,
-                             total_pages=products_pagination.pages,
-                             total_products=products_pagination.total,
-                             has_prev=products_pagination.has_prev,
-                             has_next=products_pagination.has_next,
-                             prev_num=products_pagination.prev_num,
-                             next_num=products_pagination.next_num)
+                             total_products=products_page.total,
+                             **products_page.template_args())
     except Exception as e:
         flash('فشل في تحميل المنتجات', 'error')
         logging.error(f"Products page error: {e}")
-        return render_template('admin/products.html', 
+        return render_page('admin/products.html', 'admin/_products_list.html', 
                              products=[], current_page=1, total_pages=0, total_products=0)
 
 @admin_bp.route('/products/<int:product_id>/delete', methods=['POST'])
@@ -253,15 +261,11 @@ def delete_product(product_id):
     try:
         product = Product.query.get_or_404(product_id)
         
-        # Delete related orders
-        orders = Order.query.filter_by(product_id=product_id).all()
-        for order in orders:
-            db.session.delete(order)
-        
-        db.session.delete(product)
+        # Delete related orders in bulk
+        counts = cascades.delete_product(product.id)
         db.session.commit()
         
-        flash('تم حذف المنتج وجميع طلباته بنجاح', 'success')
+        flash(f"تم حذف المنتج وجميع طلباته بنجاح (الطلبات: {counts['orders']})", 'success')
     except Exception as e:
         db.session.rollback()
         flash('فشل في حذف المنتج', 'error')
@@ -271,32 +275,25 @@ def delete_product(product_id):
 
 @admin_bp.route('/services')
 @admin_required
+@conditional(lambda: [scope(Service), scope(Store), scope(User)])
 def services():
     """Services management page"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
     try:
         # Get services with pagination
-        services_pagination = Service.query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        services_page = paginate_list(Service.query.options(*list_loaders(Service)), Service, per_page)
         
-        services_list = [service.to_dict() for service in services_pagination.items]
+        services_list = serialize(services_page.items)
         
-        return render_template('admin/services.html',
+        return render_page('admin/services.html', 'admin/_services_list.html',
                              services=services_list,
-                             current_page=page,
-                             total_pages=services_pagination.pages,
-                             total_services=services_pagination.total,
-                             has_prev=services_pagination.has_prev,
-                             has_next=services_pagination.has_next,
-                             prev_num=services_pagination.prev_num,
-                             next_num=services_pagination.next_num)
+                             total_services=services_page.total,
+                             **services_page.template_args())
     except Exception as e:
         flash('فشل في تحميل الخدمات', 'error')
         logging.error(f"Services page error: {e}")
-        return render_template('admin/services.html', 
+        return render_page('admin/services.html', 'admin/_services_list.html', 
                              services=[], current_page=1, total_pages=0, total_services=0)
 
 @admin_bp.route('/services/<int:service_id>/delete', methods=['POST'])
@@ -318,32 +315,25 @@ def delete_service(service_id):
 
 @admin_bp.route('/jobs')
 @admin_required
+@conditional(lambda: [scope(Job)])
 def jobs():
     """Jobs management page"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
     try:
         # Get jobs with pagination
-        jobs_pagination = Job.query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        jobs_page = paginate_list(Job.query, Job, per_page)
         
-        jobs_list = [job.to_dict() for job in jobs_pagination.items]
+        jobs_list = serialize(jobs_page.items)
         
-        return render_template('admin/jobs.html',
+        return render_page('admin/jobs.html', 'admin/_jobs_list.html',
                              jobs=jobs_list,
-                             current_page=page,
-                             total_pages=jobs_pagination.pages,
-                             total_jobs=jobs_pagination.total,
-                             has_prev=jobs_pagination.has_prev,
-                             has_next=jobs_pagination.has_next,
-                             prev_num=jobs_pagination.prev_num,
-                             next_num=jobs_pagination.next_num)
+                             total_jobs=jobs_page.total,
+                             **jobs_page.template_args())
     except Exception as e:
         flash('فشل في تحميل الوظائف', 'error')
         logging.error(f"Jobs page error: {e}")
-        return render_template('admin/jobs.html', 
+        return render_page('admin/jobs.html', 'admin/_jobs_list.html', 
                              jobs=[], current_page=1, total_pages=0, total_jobs=0)
 
 @admin_bp.route('/jobs/<int:job_id>/delete', methods=['POST'])
@@ -365,32 +355,25 @@ def delete_job(job_id):
 
 @admin_bp.route('/ads')
 @admin_required
+@conditional(lambda: [scope(Advertisement)])
 def ads():
     """Advertisements management page"""
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
     try:
         # Get ads with pagination
-        ads_pagination = Advertisement.query.paginate(
-            page=page, per_page=per_page, error_out=False
-        )
+        ads_page = paginate_list(Advertisement.query, Advertisement, per_page)
         
-        ads_list = [ad.to_dict() for ad in ads_pagination.items]
+        ads_list = serialize(ads_page.items)
         
-        return render_template('admin/ads.html',
+        return render_page('admin/ads.html', 'admin/_ads_list.html',
                              ads=ads_list,
-                             current_page=page,
-                             total_pages=ads_pagination.pages,
-                             total_ads=ads_pagination.total,
-                             has_prev=ads_pagination.has_prev,
-                             has_next=ads_pagination.has_next,
-                             prev_num=ads_pagination.prev_num,
-                             next_num=ads_pagination.next_num)
+                             total_ads=ads_page.total,
+                             **ads_page.template_args())
     except Exception as e:
         flash('فشل في تحميل الإعلانات', 'error')
         logging.error(f"Ads page error: {e}")
-        return render_template('admin/ads.html', 
+        return render_page('admin/ads.html', 'admin/_ads_list.html', 
                              ads=[], current_page=1, total_pages=0, total_ads=0)
 
 @admin_bp.route('/ads/<int:ad_id>/delete', methods=['POST'])
@@ -410,6 +393,121 @@ def delete_ad(ad_id):
     
     return redirect(url_for('admin.ads'))
 
+@admin_bp.route('/search')
+@admin_required
+def search():
+    """Full-text search over products, services and jobs"""
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('type', 'products')
+    if kind not in SEARCHABLE:
+        kind = 'products'
+    
+    results = []
+    try:
+        if query:
+            results = serialize(search_catalog(kind, query, limit=50))
+    except Exception as e:
+        flash('فشل في البحث', 'error')
+        logging.error(f"Search error: {e}")
+    
+    return render_template('admin/search.html', query=query, kind=kind, results=results)
+
+@admin_bp.route('/tasks')
+@admin_required
+@conditional(lambda: [scope(BackgroundTask)])
+def background_tasks():
+    """Background tasks status page"""
+    per_page = 20
+    
+    try:
+        tasks_page = paginate_list(BackgroundTask.query, BackgroundTask, per_page)
+        
+        tasks_list = serialize(tasks_page.items)
+        
+        return render_page('admin/tasks.html', 'admin/_tasks_list.html',
+                             tasks=tasks_list,
+                             total_tasks=tasks_page.total,
+                             **tasks_page.template_args())
+    except Exception as e:
+        flash('فشل في تحميل المهام', 'error')
+        logging.error(f"Tasks page error: {e}")
+        return render_page('admin/tasks.html', 'admin/_tasks_list.html', 
+                             tasks=[], current_page=1, total_pages=0, total_tasks=0)
+
+@admin_bp.route('/slow-queries')
+@admin_required
+def slow_queries():
+    """Slow statements captured by this worker, newest first"""
+    return render_template('admin/slow_queries.html',
+                         captures=slow_query_log.recent(),
+                         threshold_ms=current_app.config['SLOW_QUERY_MS'])
+
+@admin_bp.route('/tasks/rebuild-counters', methods=['POST'])
+@admin_required
+def rebuild_counters():
+    """Queue a rebuild of the dashboard counters"""
+    try:
+        queued = tasks.enqueue('rebuild_counters')
+        db.session.commit()
+        
+        flash(f'تمت جدولة إعادة حساب الإحصائيات (المهمة #{queued.id})', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash('فشل في جدولة المهمة', 'error')
+        logging.error(f"Rebuild counters task error: {e}")
+    
+    return redirect(url_for('admin.background_tasks'))
+
+@admin_bp.route('/export/<kind>')
+@admin_required
+def export(kind):
+    """Stream orders, products or users as CSV or NDJSON"""
+    list_pages = {'orders': 'admin.dashboard', 'products': 'admin.products', 'users': 'admin.users'}
+    if kind not in list_pages:
+        flash('نوع التصدير غير مدعوم', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    try:
+        filters = ExportFilters.from_args(request.args)
+        return export_response(kind, filters, request.args.get('format', 'csv'))
+    except ValueError as e:
+        flash('معايير التصدير غير صالحة', 'error')
+        logging.error(f"Export {kind} error: {e}")
+        return redirect(url_for(list_pages[kind]))
+
+@admin_bp.route('/import', methods=['GET', 'POST'])
+@admin_required
+def bulk_import():
+    """Bulk import products or services from a CSV or XLSX sheet"""
+    kind = request.values.get('type', 'products')
+    if kind not in IMPORTABLE:
+        kind = 'products'
+    
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('يرجى اختيار ملف للرفع', 'error')
+            return render_template('admin/import.html', kind=kind, result=None)
+        
+        try:
+            result = import_catalog(kind, read_sheet(upload))
+            db.session.commit()
+            
+            if result.error_count:
+                flash(f'تم استيراد {result.inserted} صفاً، وتعذر استيراد {result.error_count} صفاً', 'warning')
+            else:
+                flash(f'تم استيراد {result.inserted} صفاً بنجاح', 'success')
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+        except Exception as e:
+            db.session.rollback()
+            flash('حدث خطأ أثناء استيراد الملف', 'error')
+            logging.error(f"Bulk import error: {e}")
+    
+    return render_template('admin/import.html', kind=kind, result=result)
+
 # ==================== COMPREHENSIVE ADMIN MANAGEMENT ROUTES ====================
 
 @admin_bp.route('/users/add', methods=['GET', 'POST'])
@@ -0,0 +1,143 @@
+"""
+API response cache for BaytAlSudani Admin Dashboard
+GET responses of the remote API are kept in a per-worker LRU with a TTL,
+revalidated with If-None-Match once stale, and identical GETs in flight
+share one request; writes drop every cached resource they can affect
+"""
+import asyncio
+import copy
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import urlencode
+
+# Cached resources whose responses embed or count the written resource
+INVALIDATES = {
+    'users': ('users', 'merchants', 'stores', 'stats'),
+    'merchants': ('merchants', 'stores', 'stats'),
+    'stores': ('stores', 'merchants', 'products', 'services', 'stats'),
+    'products': ('products', 'orders', 'stats'),
+    'services': ('services', 'stats'),
+    'orders': ('orders', 'stats'),
+    'jobs': ('jobs', 'stats'),
+    'ads': ('ads', 'stats'),
+    'subscriptions': ('subscriptions', 'stats'),
+}
+
+def resource_of(endpoint: str) -> str:
+    """First path segment of an endpoint, e.g. 'products' for '/products/5'"""
+    return endpoint.strip('/').split('/', 1)[0]
+
+def cache_key(endpoint: str, params: Optional[Dict] = None) -> str:
+    query = urlencode(sorted((params or {}).items()))
+    return f"/{endpoint.strip('/')}?{query}"
+
+def affected_resources(endpoint: str) -> Iterable[str]:
+    resource = resource_of(endpoint)
+    return INVALIDATES.get(resource, (resource,))
+
+@dataclass
+class CachedResponse:
+    """Decoded body of a GET with its validator"""
+    data: Any
+    etag: Optional[str]
+    expires: float
+
+    def fresh(self) -> bool:
+        return self.expires > time.monotonic()
+
+class ResponseCache:
+    """Thread-safe LRU of GET responses; subclass to back it with another store"""
+
+    def __init__(self, size: int = 512, ttl: float = 30):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Bumped by every invalidation so responses fetched before a write are not stored
+        self.generation = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Entry for a key, kept even when stale so it can be revalidated"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, data: Any, etag: Optional[str], generation: int) -> None:
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = CachedResponse(data, etag, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, endpoint: str) -> None:
+        """Drop every cached response a write to the endpoint can affect"""
+        resources = set(affected_resources(endpoint))
+        with self.lock:
+            self.generation += 1
+            for key in [key for key in self.entries if resource_of(key.split('?', 1)[0]) in resources]:
+                del self.entries[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Runs one call per key at a time, handing its result to every waiting caller"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights: Dict[str, _Flight] = {}
+
+    def run(self, key: str, call):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+
+        if leader:
+            try:
+                flight.result = call()
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self.lock:
+                    del self.flights[key]
+                flight.done.set()
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        # Every caller gets its own copy, since views may modify what they receive
+        return copy.deepcopy(flight.result)
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop"""
+
+    def __init__(self):
+        self.flights: Dict[str, asyncio.Future] = {}
+
+    async def run(self, key: str, call):
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(call())
+            self.flights[key] = flight
+            flight.add_done_callback(lambda done: self.flights.pop(key, None))
+        # A cancelled waiter must not cancel the request the others are waiting on
+        result = await asyncio.shield(flight)
+        return copy.deepcopy(result)
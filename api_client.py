@@ -1,44 +1,80 @@
+import asyncio
+import httpx
 import requests
 import os
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, List, Optional, Tuple
+from api_cache import AsyncSingleFlight, CachedResponse, ResponseCache, SingleFlight, cache_key
+from api_resilience import APIUnavailable, Attempts, BreakerRegistry, page_deadline
+import metrics
 
-class APIClient:
-    """Client for communicating with the existing BaytAlSudani API"""
-    
-    def __init__(self):
-        self.base_url = os.environ.get('API_BASE_URL', 'http://localhost:8000/api')
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'Accept': 'application/json'
-        })
-    
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, params: Optional[Dict] = None) -> Dict:
-        """Make HTTP request to API"""
-        url = f"{self.base_url}/{endpoint.lstrip('/')}"
-        
-        try:
-            response = self.session.request(
-                method=method,
-                url=url,
-                json=data,
-                params=params,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            elif response.status_code == 404:
-                return {'error': 'البيانات غير موجودة', 'status_code': 404}
-            elif response.status_code == 401:
-                return {'error': 'غير مصرح بالوصول', 'status_code': 401}
-            else:
-                return {'error': f'خطأ في الخادم: {response.status_code}', 'status_code': response.status_code}
-                
-        except requests.exceptions.RequestException as e:
-            logging.error(f"API request failed: {e}")
-            return {'error': 'فشل في الاتصال بالخادم', 'exception': str(e)}
+
+# Seconds to establish a connection, and to wait for each response once connected
+API_CONNECT_TIMEOUT = float(os.environ.get('API_CONNECT_TIMEOUT', 3.05))
+API_READ_TIMEOUT = float(os.environ.get('API_READ_TIMEOUT', 10))
+# Connections kept open to the API by each transport of a worker
+API_MAX_CONNECTIONS = int(os.environ.get('API_MAX_CONNECTIONS', 20))
+# Extra attempts for idempotent GETs after transport errors and 502/503/504
+API_RETRIES = int(os.environ.get('API_RETRIES', 2))
+API_RETRY_BACKOFF = float(os.environ.get('API_RETRY_BACKOFF', 0.2))
+# Consecutive failures that open an endpoint's breaker, and seconds before it is tried again
+API_BREAKER_THRESHOLD = int(os.environ.get('API_BREAKER_THRESHOLD', 5))
+API_BREAKER_RESET = float(os.environ.get('API_BREAKER_RESET', 30))
+# GET responses are reused for the TTL (seconds, 0 disables) and revalidated afterwards
+API_CACHE_TTL = float(os.environ.get('API_CACHE_TTL', 30))
+API_CACHE_SIZE = int(os.environ.get('API_CACHE_SIZE', 512))
+
+def _parse_response(status_code: int, payload) -> Dict:
+    """Map an API response to its data or an error dict"""
+    if status_code == 200:
+        return payload()
+    elif status_code == 404:
+        return {'error': 'البيانات غير موجودة', 'status_code': 404}
+    elif status_code == 401:
+        return {'error': 'غير مصرح بالوصول', 'status_code': 401}
+    else:
+        return {'error': f'خطأ في الخادم: {status_code}', 'status_code': status_code}
+
+def _connection_error(e: Exception) -> Dict:
+    if isinstance(e, APIUnavailable):
+        return {'error': e.message, 'status_code': 503}
+    logging.error(f"API request failed: {e}")
+    return {'error': 'فشل في الاتصال بالخادم', 'exception': str(e)}
+
+def _validators(entry: Optional[CachedResponse]) -> Optional[Dict]:
+    if entry is not None and entry.etag:
+        return {'If-None-Match': entry.etag}
+    return None
+
+def _attempts(breakers: BreakerRegistry, method: str, endpoint: str) -> Attempts:
+    return Attempts(breakers.get(endpoint), method, API_READ_TIMEOUT, API_RETRIES, API_RETRY_BACKOFF)
+
+def _start_attempt(attempts: Attempts, method: str, endpoint: str) -> float:
+    try:
+        return attempts.start()
+    except APIUnavailable as e:
+        metrics.count_api_refusal(method, endpoint, e)
+        raise
+
+def _cache_response(cache: ResponseCache, key: str, entry: Optional[CachedResponse], generation: int,
+                    status_code: int, etag: Optional[str], payload) -> Dict:
+    """Response data, storing successful GETs and renewing revalidated ones"""
+    if entry is not None and status_code == 304:
+        cache.set(key, entry.data, entry.etag, generation)
+        return entry.data
+    if entry is not None and status_code >= 500:
+        # A stale copy beats an error page while the API is failing
+        return entry.data
+    result = _parse_response(status_code, payload)
+    if status_code == 200:
+        cache.set(key, result, etag, generation)
+    return result
+
+class _Endpoints:
+    """API methods shared by the clients; on AsyncAPIClient they return awaitables"""
     
     # Authentication methods
     def login_admin(self, username: str, password: str) -> Dict:
@@ -209,5 +245,211 @@ class APIClient:
         """Get subscription history"""
         return self._make_request('GET', f'/subscriptions/{merchant_id}/history')
 
+class AsyncAPIClient(_Endpoints):
+    """Asynchronous client on a pooled httpx transport, bound to one event loop"""
+    
+    def __init__(self, base_url: Optional[str] = None, cache: Optional[ResponseCache] = None,
+                 breakers: Optional[BreakerRegistry] = None):
+        self.base_url = base_url or os.environ.get('API_BASE_URL', 'http://localhost:8000/api')
+        self.cache = cache
+        self.breakers = breakers or BreakerRegistry(API_BREAKER_THRESHOLD, API_BREAKER_RESET)
+        self._flights = AsyncSingleFlight()
+        self.client = httpx.AsyncClient(
+            headers={
+                'Content-Type': 'application/json',
+                'Accept': 'application/json'
+            },
+            timeout=httpx.Timeout(API_READ_TIMEOUT, connect=API_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=API_MAX_CONNECTIONS,
+                max_keepalive_connections=API_MAX_CONNECTIONS
+            )
+        )
+    
+    async def _send(self, method: str, endpoint: str, data: Optional[Dict] = None,
+                    params: Optional[Dict] = None, headers: Optional[Dict] = None):
+        """Send under the endpoint's breaker and the page deadline, retrying idempotent calls"""
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        attempts = _attempts(self.breakers, method, endpoint)
+        # Every exit resolves the attempt, so a half-open breaker never keeps a lost trial
+        try:
+            while True:
+                read_timeout = _start_attempt(attempts, method, endpoint)
+                started = time.perf_counter()
+                try:
+                    response = await self.client.request(
+                        method, url, json=data, params=params, headers=headers,
+                        timeout=httpx.Timeout(read_timeout, connect=API_CONNECT_TIMEOUT)
+                    )
+                except httpx.TransportError:
+                    metrics.observe_api_call(method, endpoint, started, 'transport_error')
+                    delay = attempts.retry_delay()
+                    if delay is None:
+                        raise
+                else:
+                    metrics.observe_api_call(method, endpoint, started, f'{response.status_code // 100}xx')
+                    delay = attempts.retry_delay(response.status_code)
+                    if delay is None:
+                        return response
+                await asyncio.sleep(delay)
+        finally:
+            attempts.finish()
+    
+    async def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, params: Optional[Dict] = None) -> Dict:
+        """Make HTTP request to API"""
+        if self.cache is not None and method == 'GET':
+            key = cache_key(endpoint, params)
+            return await self._flights.run(key, lambda: self._cached_get(key, endpoint, params))
+        
+        try:
+            response = await self._send(method, endpoint, data, params)
+            return _parse_response(response.status_code, response.json)
+        except (httpx.HTTPError, APIUnavailable, ValueError) as e:
+            return _connection_error(e)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(endpoint)
+    
+    async def _cached_get(self, key: str, endpoint: str, params: Optional[Dict]) -> Dict:
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh():
+            return entry.data
+        generation = self.cache.generation
+        try:
+            response = await self._send('GET', endpoint, params=params, headers=_validators(entry))
+            return _cache_response(
+                self.cache, key, entry, generation,
+                response.status_code, response.headers.get('ETag'), response.json
+            )
+        except (httpx.HTTPError, APIUnavailable, ValueError) as e:
+            if entry is not None:
+                return entry.data
+            return _connection_error(e)
+    
+    async def gather(self, *calls: Tuple, deadline: Optional[float] = None) -> List[Dict]:
+        """Run (method_name, *args) calls concurrently, results in call order"""
+        # Set in this task's context, so every call below shares the caller's page deadline
+        page_deadline.set(deadline)
+        results = await asyncio.gather(
+            *(getattr(self, name)(*args) for name, *args in calls),
+            return_exceptions=True
+        )
+        return [_connection_error(result) if isinstance(result, Exception) else result for result in results]
+    
+    async def aclose(self):
+        await self.client.aclose()
+
+class _LoopThread:
+    """Event loop running in a daemon thread, shared by the requests of a worker"""
+    
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='api-client-loop', daemon=True)
+        self.thread.start()
+    
+    def run(self, coroutine, timeout: Optional[float] = None) -> Any:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+class APIClient(_Endpoints):
+    """Client for communicating with the existing BaytAlSudani API"""
+    
+    def __init__(self, cache: Optional[ResponseCache] = None):
+        self.base_url = os.environ.get('API_BASE_URL', 'http://localhost:8000/api')
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        })
+        # Retries are done by _send, where they respect the breaker and deadline
+        adapter = HTTPAdapter(pool_maxsize=API_MAX_CONNECTIONS, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.breakers = BreakerRegistry(API_BREAKER_THRESHOLD, API_BREAKER_RESET)
+        # The async client shares the cache, so writes through either invalidate both
+        self.cache = cache
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._async_client = None
+    
+    def _send(self, method: str, endpoint: str, data: Optional[Dict] = None,
+              params: Optional[Dict] = None, headers: Optional[Dict] = None):
+        """Send under the endpoint's breaker and the page deadline, retrying idempotent calls"""
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        attempts = _attempts(self.breakers, method, endpoint)
+        # Every exit resolves the attempt, so a half-open breaker never keeps a lost trial
+        try:
+            while True:
+                read_timeout = _start_attempt(attempts, method, endpoint)
+                started = time.perf_counter()
+                try:
+                    response = self.session.request(
+                        method=method,
+                        url=url,
+                        json=data,
+                        params=params,
+                        headers=headers,
+                        timeout=(API_CONNECT_TIMEOUT, read_timeout)
+                    )
+                except requests.exceptions.RequestException:
+                    metrics.observe_api_call(method, endpoint, started, 'transport_error')
+                    delay = attempts.retry_delay()
+                    if delay is None:
+                        raise
+                else:
+                    metrics.observe_api_call(method, endpoint, started, f'{response.status_code // 100}xx')
+                    delay = attempts.retry_delay(response.status_code)
+                    if delay is None:
+                        return response
+                time.sleep(delay)
+        finally:
+            attempts.finish()
+    
+    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, params: Optional[Dict] = None) -> Dict:
+        """Make HTTP request to API"""
+        if self.cache is not None and method == 'GET':
+            key = cache_key(endpoint, params)
+            return self._flights.run(key, lambda: self._cached_get(key, endpoint, params))
+        
+        try:
+            response = self._send(method, endpoint, data, params)
+            return _parse_response(response.status_code, response.json)
+        except (requests.exceptions.RequestException, APIUnavailable, ValueError) as e:
+            return _connection_error(e)
+        finally:
+            # Even failed writes may have been applied, so their resources are refetched
+            if self.cache is not None:
+                self.cache.invalidate(endpoint)
+    
+    def _cached_get(self, key: str, endpoint: str, params: Optional[Dict]) -> Dict:
+        entry = self.cache.get(key)
+        if entry is not None and entry.fresh():
+            return entry.data
+        generation = self.cache.generation
+        try:
+            response = self._send('GET', endpoint, params=params, headers=_validators(entry))
+            return _cache_response(
+                self.cache, key, entry, generation,
+                response.status_code, response.headers.get('ETag'), response.json
+            )
+        except (requests.exceptions.RequestException, APIUnavailable, ValueError) as e:
+            if entry is not None:
+                return entry.data
+            return _connection_error(e)
+    
+    def _async(self) -> AsyncAPIClient:
+        """The worker's async client and its loop, started on first use"""
+        with self._lock:
+            if self._async_client is None:
+                self._loop = _LoopThread()
+                self._async_client = AsyncAPIClient(self.base_url, self.cache, self.breakers)
+            return self._async_client
+    
+    def gather(self, *calls: Tuple) -> List[Dict]:
+        """Run independent (method_name, *args) calls concurrently, results in call order"""
+        async_client = self._async()
+        # The loop thread does not see this thread's context, so the deadline is handed over
+        return self._loop.run(async_client.gather(*calls, deadline=page_deadline.get()))
+
 # Global API client instance
-api_client = APIClient()
+api_client = APIClient(ResponseCache(API_CACHE_SIZE, API_CACHE_TTL) if API_CACHE_TTL > 0 else None)
@@ -3,9 +3,10 @@ Local API Client for BaytAlSudani Admin Dashboard
 Provides internal API endpoints for the dashboard
 """
 from flask import jsonify, request
-from models import db, User, Store, Product, Service, Order, Advertisement, Job
+from models import User, Store, Product, Service, Order
 from auth import authenticate_user
-from sqlalchemy import func
+from stats import get_dashboard_stats
+from serializers import list_loaders, serialize
 
 class LocalAPIClient:
     """Local API client for internal operations"""
@@ -45,7 +46,7 @@ class LocalAPIClient:
             )
             
             return {
-                'users': [user.to_dict() for user in pagination.items],
+                'users': serialize(pagination.items),
                 'total': pagination.total,
                 'pages': pagination.pages,
                 'current_page': page
@@ -57,12 +58,12 @@ class LocalAPIClient:
     def get_stores(page=1, limit=20):
         """Get stores with pagination"""
         try:
-            pagination = Store.query.paginate(
+            pagination = Store.query.options(*list_loaders(Store)).paginate(
                 page=page, per_page=limit, error_out=False
             )
             
             return {
-                'stores': [store.to_dict() for store in pagination.items],
+                'stores': serialize(pagination.items),
                 'total': pagination.total,
                 'pages': pagination.pages,
                 'current_page': page
@@ -74,7 +75,7 @@ class LocalAPIClient:
     def get_products(page=1, limit=20, store_id=None):
         """Get products with pagination"""
         try:
-            query = Product.query
+            query = Product.query.options(*list_loaders(Product))
             if store_id:
                 query = query.filter_by(store_id=store_id)
             
@@ -83,7 +84,7 @@ class LocalAPIClient:
             )
             
             return {
-                'products': [product.to_dict() for product in pagination.items],
+                'products': serialize(pagination.items),
                 'total': pagination.total,
                 'pages': pagination.pages,
                 'current_page': page
@@ -95,7 +96,7 @@ class LocalAPIClient:
     def get_services(page=1, limit=20, store_id=None):
         """Get services with pagination"""
         try:
-            query = Service.query
+            query = Service.query.options(*list_loaders(Service))
             if store_id:
                 query = query.filter_by(store_id=store_id)
             
@@ -104,7 +105,7 @@ class LocalAPIClient:
             )
             
             return {
-                'services': [service.to_dict() for service in pagination.items],
+                'services': serialize(pagination.items),
                 'total': pagination.total,
                 'pages': pagination.pages,
                 'current_page': page
@@ -116,7 +117,7 @@ class LocalAPIClient:
     def get_orders(page=1, limit=20, store_id=None, merchant_id=None):
         """Get orders with pagination"""
         try:
-            query = Order.query
+            query = Order.query.options(*list_loaders(Order))
             if merchant_id:
                 query = query.filter_by(merchant_id=merchant_id)
             elif store_id:
@@ -128,7 +129,7 @@ class LocalAPIClient:
             )
             
             return {
-                'orders': [order.to_dict() for order in pagination.items],
+                'orders': serialize(pagination.items),
                 'total': pagination.total,
                 'pages': pagination.pages,
                 'current_page': page
@@ -140,18 +141,7 @@ class LocalAPIClient:
     def get_stats():
         """Get dashboard statistics"""
         try:
-            return {
-                'total_users': User.query.filter_by(role='merchant').count(),
-                'total_admins': User.query.filter_by(role='admin').count(),
-                'total_stores': Store.query.count(),
-                'total_products': Product.query.count(),
-                'total_services': Service.query.count(),
-                'total_orders': Order.query.count(),
-                'pending_orders': Order.query.filter_by(status='pending').count(),
-                'total_revenue': db.session.query(func.sum(Order.total_price)).filter_by(
-                    status='delivered'
-                ).scalar() or 0
-            }
+            return get_dashboard_stats().to_dict()
         except Exception as e:
             return {'error': f'فشل في جلب الإحصائيات: {str(e)}'}
 
@@ -0,0 +1,159 @@
+"""
+Remote API resilience for BaytAlSudani Admin Dashboard
+Every call runs under a per-endpoint circuit breaker and the current
+page's deadline, and idempotent GETs are retried with jittered
+exponential backoff, so a stalled API fails pages fast instead of
+holding worker threads
+"""
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Gateway errors worth retrying; any 5xx or transport error counts against an endpoint's health
+RETRY_STATUSES = {502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD'}
+
+page_deadline: ContextVar[Optional[float]] = ContextVar('api_page_deadline', default=None)
+
+class APIUnavailable(Exception):
+    """Raised instead of calling the API when no useful answer can come back in time"""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+class CircuitOpen(APIUnavailable):
+    pass
+
+class DeadlineExceeded(APIUnavailable):
+    pass
+
+def start_deadline(seconds):
+    """Give the remote calls of the current page this many seconds in total"""
+    page_deadline.set(time.monotonic() + seconds if seconds and seconds > 0 else None)
+
+def clear_deadline():
+    page_deadline.set(None)
+
+def remaining_time() -> Optional[float]:
+    """Seconds left in the page's budget, or None without a deadline"""
+    deadline = page_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def endpoint_key(endpoint: str) -> str:
+    """Endpoint with ids folded, so '/products/5' and '/products/7' share a breaker"""
+    return re.sub(r'/\d+(?=/|$)', '/:id', '/' + endpoint.strip('/'))
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets one trial call through per reset timeout"""
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.trial_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if self.trial or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            now = time.monotonic()
+            # A trial that never reported back is given up after the reset timeout
+            if self.trial and now - self.trial_at >= self.reset_timeout:
+                self.trial = False
+            if not self.trial and now - self.opened_at >= self.reset_timeout:
+                self.trial = True
+                self.trial_at = now
+                return
+        raise CircuitOpen('الخدمة غير متاحة مؤقتاً، يرجى المحاولة لاحقاً')
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+class BreakerRegistry:
+    """One breaker per endpoint, created on first use"""
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.lock = threading.Lock()
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        key = endpoint_key(endpoint)
+        with self.lock:
+            breaker = self.breakers.get(key)
+            if breaker is None:
+                breaker = self.breakers[key] = CircuitBreaker(self.threshold, self.reset_timeout)
+            return breaker
+
+class Attempts:
+    """Breaker, deadline and retry decisions for one logical API call"""
+
+    def __init__(self, breaker: CircuitBreaker, method: str, read_timeout: float,
+                 retries: int = 2, backoff: float = 0.2, max_backoff: float = 2):
+        self.breaker = breaker
+        self.read_timeout = read_timeout
+        self.retries = retries if method.upper() in IDEMPOTENT_METHODS else 0
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.attempt = 0
+        self.in_flight = False
+
+    def start(self) -> float:
+        """Read timeout for the next attempt, raising when it must not be made"""
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded('انتهت مهلة الاتصال بالخادم')
+        # Checked last, since a half-open breaker hands out its one trial here
+        self.breaker.allow()
+        self.in_flight = True
+        return self.read_timeout if remaining is None else min(self.read_timeout, remaining)
+
+    def retry_delay(self, status_code: Optional[int] = None) -> Optional[float]:
+        """Record an attempt's outcome; seconds to wait before retrying, or None to stop"""
+        self.in_flight = False
+        if status_code is not None and status_code < 500:
+            self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        if (status_code is not None and status_code not in RETRY_STATUSES) or self.attempt >= self.retries:
+            return None
+
+        # Full jitter keeps retrying workers from hitting the API in lockstep
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** self.attempt))
+        self.attempt += 1
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+    def finish(self):
+        """Count an attempt that ended without an outcome, e.g. cancelled, as failed"""
+        if self.in_flight:
+            self.in_flight = False
+            self.breaker.record_failure()
@@ -1,6 +1,9 @@
 import os
+import hmac
 import logging
-from flask import Flask, redirect, url_for
+import time
+import click
+from flask import Flask, g, redirect, request, url_for
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager
 from datetime import datetime
@@ -11,7 +14,7 @@ logging.basicConfig(level=logging.DEBUG)
 # Create the Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "bayt-al-sudani-secret-key-2025-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 
 # Database configuration
 database_url = os.environ.get("DATABASE_URL")
@@ -24,11 +27,132 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+if not database_url.startswith('sqlite'):
+    # Counts checkouts that time out for the metrics endpoint
+    from metrics import MeteredQueuePool
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["poolclass"] = MeteredQueuePool
+
+# List pagination: 'offset' for numbered pages, 'keyset' for cursor links
+app.config['PAGINATION_MODE'] = os.environ.get('PAGINATION_MODE', 'offset')
+app.config['PAGINATION_TOTALS'] = os.environ.get('PAGINATION_TOTALS', '1').lower() in ('1', 'true')
+# Listing totals: 'exact', 'cached' (exact, reused for the TTL) or 'estimate' (planner rows)
+app.config['PAGINATION_COUNT_MODE'] = os.environ.get('PAGINATION_COUNT_MODE', 'exact')
+app.config['PAGINATION_COUNT_TTL'] = int(os.environ.get('PAGINATION_COUNT_TTL', 60))
+app.config['PAGINATION_ESTIMATE_THRESHOLD'] = int(os.environ.get('PAGINATION_ESTIMATE_THRESHOLD', 100000))
+
+# Raise instead of warning when serialization triggers a lazy load (used in tests)
+app.config['STRICT_SERIALIZATION'] = os.environ.get('STRICT_SERIALIZATION', '').lower() in ('1', 'true')
+
+# Background tasks: in-process worker threads per gunicorn worker (0 to rely on 'flask run-tasks')
+app.config['TASK_WORKERS'] = int(os.environ.get('TASK_WORKERS', 1))
+app.config['TASK_POLL_INTERVAL'] = float(os.environ.get('TASK_POLL_INTERVAL', 2))
+app.config['TASK_MAX_ATTEMPTS'] = int(os.environ.get('TASK_MAX_ATTEMPTS', 3))
+app.config['TASK_RETRY_BACKOFF'] = int(os.environ.get('TASK_RETRY_BACKOFF', 30))
+app.config['TASK_VISIBILITY_TIMEOUT'] = int(os.environ.get('TASK_VISIBILITY_TIMEOUT', 900))
+
+# Seconds 'flask migrate' waits for another deploy's migrations before failing
+app.config['MIGRATION_LOCK_TIMEOUT'] = int(os.environ.get('MIGRATION_LOCK_TIMEOUT', 600))
+
+# Dashboard reads queue a refresh of the daily order rollups at most this often (seconds)
+app.config['ROLLUP_REFRESH_INTERVAL'] = int(os.environ.get('ROLLUP_REFRESH_INTERVAL', 60))
+
+# Live feed streams: keepalive comment interval, which is also how long a closed tab keeps its
+# thread, and lifetime before the client reconnects (seconds); streams each hold a request
+# thread, so a worker keeps at most FEED_MAX_STREAMS of its threads (0 for no limit)
+app.config['FEED_HEARTBEAT'] = int(os.environ.get('FEED_HEARTBEAT', 10))
+app.config['FEED_MAX_STREAM_SECONDS'] = int(os.environ.get('FEED_MAX_STREAM_SECONDS', 300))
+app.config['FEED_MAX_STREAMS'] = int(os.environ.get('FEED_MAX_STREAMS', 8))
+
+# Password hashing: Werkzeug method with cost, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000';
+# hashes made under another method are upgraded on the next successful login
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+app.config['PASSWORD_SALT_LENGTH'] = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+
+# Login limits per worker: failures per username and per client address within the window
+# (seconds), and password checks running at once, waiting at most the queue timeout for a slot
+app.config['LOGIN_MAX_FAILURES_PER_USER'] = int(os.environ.get('LOGIN_MAX_FAILURES_PER_USER', 5))
+app.config['LOGIN_MAX_FAILURES_PER_ADDRESS'] = int(os.environ.get('LOGIN_MAX_FAILURES_PER_ADDRESS', 20))
+app.config['LOGIN_FAILURE_WINDOW'] = int(os.environ.get('LOGIN_FAILURE_WINDOW', 300))
+app.config['LOGIN_MAX_CONCURRENT'] = int(os.environ.get('LOGIN_MAX_CONCURRENT', 2))
+app.config['LOGIN_QUEUE_TIMEOUT'] = float(os.environ.get('LOGIN_QUEUE_TIMEOUT', 2))
+
+# Signed-in users are cached per worker for the TTL (seconds, 0 disables); changes evict them at once
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+
+# Merchant data: 'local' queries the dashboard database in-process, 'remote' goes through the API
+app.config['DATA_BACKEND'] = os.environ.get('DATA_BACKEND', 'local')
+if app.config['DATA_BACKEND'] not in ('local', 'remote'):
+    raise RuntimeError("DATA_BACKEND must be 'local' or 'remote'")
+
+# Total seconds the remote API calls of one page may take before failing fast (0 disables)
+app.config['API_PAGE_BUDGET'] = float(os.environ.get('API_PAGE_BUDGET', 8))
+
+# Request profiling: Server-Timing header and a log line per request with the slowest
+# statements, flagging statement shapes repeated at least the threshold times as N+1 suspects
+app.config['REQUEST_PROFILING'] = os.environ.get('REQUEST_PROFILING', '1').lower() in ('1', 'true')
+app.config['PROFILE_SLOWEST_QUERIES'] = int(os.environ.get('PROFILE_SLOWEST_QUERIES', 5))
+app.config['PROFILE_REPEAT_THRESHOLD'] = int(os.environ.get('PROFILE_REPEAT_THRESHOLD', 5))
+
+# Slow query log: SELECTs slower than the threshold (ms, 0 disables) are kept in a per-worker
+# ring buffer for the admin viewer, with an EXPLAIN plan per statement shape and interval (seconds)
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', 500))
+app.config['SLOW_QUERY_BUFFER'] = int(os.environ.get('SLOW_QUERY_BUFFER', 100))
+app.config['SLOW_QUERY_EXPLAIN'] = os.environ.get('SLOW_QUERY_EXPLAIN', '1').lower() in ('1', 'true')
+app.config['SLOW_QUERY_EXPLAIN_TIMEOUT_MS'] = int(os.environ.get('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 5000))
+app.config['SLOW_QUERY_EXPLAIN_INTERVAL'] = int(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL', 300))
+
+# Bearer token required by /metrics (empty leaves it open, e.g. behind a private scrape network)
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+
+# Mixed into page ETags; change it to invalidate cached pages after a template deploy
+app.config['ETAG_SALT'] = os.environ.get('ETAG_SALT', '')
 
 # Initialize extensions
-from models import db, User
+from models import db
 db.init_app(app)
 
+from passwords import password_policy
+password_policy.configure(app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_SALT_LENGTH'])
+from login_limits import login_limiter
+login_limiter.configure(
+    app.config['LOGIN_MAX_FAILURES_PER_USER'],
+    app.config['LOGIN_MAX_FAILURES_PER_ADDRESS'],
+    app.config['LOGIN_FAILURE_WINDOW'],
+    app.config['LOGIN_MAX_CONCURRENT'],
+    app.config['LOGIN_QUEUE_TIMEOUT']
+)
+
+# Keep dashboard counters up to date on every flush
+from counters import register_listeners, init_counters, rebuild_counters
+register_listeners()
+
+# Publish order changes to the live feed
+import feed
+feed.register_listeners()
+feed.broadcaster.max_streams = app.config['FEED_MAX_STREAMS']
+
+# Report database pool usage to the metrics endpoint
+import metrics
+with app.app_context():
+    metrics.instrument_pool(db.engine)
+
+# Capture slow statements with their plans
+import slow_queries
+slow_queries.register_listeners(app.config['SLOW_QUERY_MS'])
+slow_queries.slow_query_log.configure(
+    app.config['SLOW_QUERY_MS'],
+    app.config['SLOW_QUERY_BUFFER'],
+    app.config['SLOW_QUERY_EXPLAIN'],
+    app.config['SLOW_QUERY_EXPLAIN_TIMEOUT_MS'],
+    app.config['SLOW_QUERY_EXPLAIN_INTERVAL']
+)
+
+# Serve the signed-in user from a per-worker cache, evicted when users change
+import identity
+identity.register_listeners()
+identity.identity_cache.configure(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
 # Initialize Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -38,15 +162,105 @@ login_manager.login_message_category = 'error'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return identity.load_identity(user_id)
 
-# Create database tables and initialize default data
+# Create database tables and initialize default data; existing databases are
+# migrated by 'flask migrate' before deploying, never by the workers themselves
+from migrations import migration_lock, pending_migrations, run_migrations
+from tasks import start_workers
+from rollups import refresh_rollups
 with app.app_context():
     db.create_all()
+    pending = pending_migrations()
+    if pending:
+        logging.warning(f"Database schema is behind, pending migrations {[m.version for m in pending]}: run 'flask migrate'")
     # Initialize default admin user
     from auth import init_default_admin
     init_default_admin()
 
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations and build missing dashboard counters"""
+    applied = run_migrations(app.config['MIGRATION_LOCK_TIMEOUT'])
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+    # Under the migration lock, so concurrent deploys build the counters once
+    with migration_lock(app.config['MIGRATION_LOCK_TIMEOUT']):
+        init_counters()
+
+@app.cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Rebuild dashboard counters from scratch"""
+    count = rebuild_counters()
+    print(f"Rebuilt {count} dashboard counters")
+
+@app.cli.command('refresh-rollups')
+@click.option('--full', is_flag=True, help='Rebuild every day instead of changed days only')
+def refresh_rollups_command(full):
+    """Fold changed orders into the daily rollups"""
+    days = refresh_rollups(full=full)
+    print("Rebuilt all daily rollups" if days is None else f"Refreshed {len(days)} days of rollups")
+
+@app.cli.command('run-tasks')
+@click.option('--workers', default=1, help='Number of worker threads')
+def run_tasks_command(workers):
+    """Run background task workers in the foreground"""
+    for worker in start_workers(app, workers):
+        worker.join()
+
+# Profile every request from its first hook on, so later hooks are measured too
+import profiling
+profiling.register_listeners()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def start_request_profile():
+    if app.config['REQUEST_PROFILING'] and request.endpoint != 'static':
+        profiling.start_profile(app.config['PROFILE_SLOWEST_QUERIES'], app.config['PROFILE_REPEAT_THRESHOLD'])
+
+@app.after_request
+def add_server_timing(response):
+    summary = profiling.finish_profile()
+    if summary is not None:
+        response.headers['Server-Timing'] = profiling.server_timing(summary)
+        profiling.log_profile(request.method, request.path, response.status_code, summary)
+    return response
+
+@app.after_request
+def observe_request_latency(response):
+    if request.endpoint != 'static' and 'request_started' in g:
+        metrics.observe_request(
+            request.blueprint, request.endpoint, request.method, response.status_code, g.request_started
+        )
+    return response
+
+@app.teardown_request
+def clear_request_profile(error=None):
+    profiling.clear_profile()
+
+# Start in-process task workers with the first request rather than at import,
+# so CLI commands and the gunicorn master never spawn them
+@app.before_request
+def ensure_task_workers():
+    if app.config['TASK_WORKERS'] > 0:
+        start_workers(app)
+
+# Every page starts with a fresh budget for its remote API calls
+from api_resilience import start_deadline, clear_deadline
+
+@app.before_request
+def start_api_budget():
+    start_deadline(app.config['API_PAGE_BUDGET'])
+
+@app.teardown_request
+def clear_api_budget(error=None):
+    clear_deadline()
+
+from pagination import format_approx_count
+app.add_template_filter(format_approx_count, 'approx_count')
+
 # Add template context processors
 @app.context_processor
 def inject_now():
@@ -65,6 +279,15 @@ def index():
     """Root route redirects to admin login"""
     return redirect(url_for('admin.login'))
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics aggregated over every worker"""
+    token = app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return "غير مصرح بالوصول", 401
+    body, content_type = metrics.exposition()
+    return body, 200, {'Content-Type': content_type}
+
 @app.errorhandler(404)
 def not_found(error):
     return redirect(url_for('admin.login'))
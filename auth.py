@@ -5,6 +5,7 @@ from functools import wraps
 from flask import session, redirect, url_for, request, flash
 from flask_login import login_required, current_user
 from models import User, db
+from login_limits import login_limiter
 
 def admin_required(f):
     """Decorator to require admin authentication"""
@@ -58,12 +59,32 @@ def authenticate_user(username_or_email, password, role):
         ).first()
         
         if user and user.check_password(password):
+            # Upgrade hashes made under an older policy while the password is known
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Password rehash error: {e}")
             return user
         return None
     except Exception as e:
         print(f"Authentication error: {e}")
         return None
 
+def throttled_authenticate(username_or_email, password, role):
+    """Authenticate under the login limiter, raising LoginThrottled when refused"""
+    address = request.remote_addr or ''
+    login_limiter.check(username_or_email, address)
+    with login_limiter.admission():
+        user = authenticate_user(username_or_email, password, role)
+    if user:
+        login_limiter.succeeded(username_or_email)
+    else:
+        login_limiter.failed(username_or_email, address)
+    return user
+
 def create_admin_user(username, password, email=None):
     """Create admin user"""
     try:
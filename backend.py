@@ -0,0 +1,287 @@
+"""
+Data backends for BaytAlSudani Admin Dashboard
+Merchant views read and write through a backend: LocalBackend runs the
+queries in-process against the dashboard database, RemoteBackend forwards
+them to the BaytAlSudani API over HTTP; DATA_BACKEND selects one
+"""
+from decimal import Decimal, InvalidOperation
+from flask import current_app
+from sqlalchemy import select
+from models import db, Store, Product, Service, Order
+from serializers import list_loaders, serialize
+from stats import ORDER_STATUSES
+from api_client import api_client
+import cascades
+import logging
+
+NOT_FOUND = {'error': 'البيانات غير موجودة', 'status_code': 404}
+NO_STORE = {'error': 'لا يوجد متجر مرتبط بحسابك', 'status_code': 404}
+
+def catalog_fields(form):
+    """Validated fields of a product or service form, or an error message"""
+    name = (form.get('name') or '').strip()
+    if not name:
+        return None, 'الاسم مطلوب'
+    if len(name) > 100:
+        return None, 'الاسم أطول من 100 حرف'
+    try:
+        price = Decimal((form.get('price') or '0').strip())
+        if not price.is_finite() or price < 0:
+            raise InvalidOperation()
+    except InvalidOperation:
+        return None, 'السعر يجب أن يكون رقماً موجباً'
+    return {
+        'name': name,
+        'description': (form.get('description') or '').strip(),
+        'price': price,
+        'category': form.get('category'),
+    }, None
+
+class LocalBackend:
+    """Answers from the dashboard database in-process, without serialization or network hops"""
+
+    # Pages rendered from it can be versioned by the local tables
+    local = True
+
+    def _store(self, merchant_id):
+        return Store.query.filter_by(merchant_id=merchant_id).order_by(Store.id).first()
+
+    def _write(self, action, message):
+        """Run a write and commit it, turning failures into an error dict with the message"""
+        try:
+            result = action()
+            db.session.commit()
+            return result
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Local backend write error: {e}")
+            return {'error': message}
+
+    def get_merchant_store(self, merchant_id):
+        store = self._store(merchant_id)
+        return store.to_dict() if store else NO_STORE
+
+    def create_product(self, merchant_id, form):
+        fields, error = catalog_fields(form)
+        if error:
+            return {'error': error}
+        store = self._store(merchant_id)
+        if store is None:
+            return NO_STORE
+
+        def create():
+            product = Product(
+                name=fields['name'], description=fields['description'], price=fields['price'],
+                merchant_id=merchant_id, store_id=store.id
+            )
+            db.session.add(product)
+            db.session.flush()
+            return {'id': product.id}
+        return self._write(create, 'فشل في إضافة المنتج')
+
+    def update_product(self, merchant_id, product_id, form):
+        fields, error = catalog_fields(form)
+        if error:
+            return {'error': error}
+        product = Product.query.filter_by(id=product_id, merchant_id=merchant_id).first()
+        if product is None:
+            return NOT_FOUND
+
+        def update():
+            product.name = fields['name']
+            product.description = fields['description']
+            product.price = fields['price']
+            return {'id': product.id}
+        return self._write(update, 'فشل في تحديث المنتج')
+
+    def delete_product(self, merchant_id, product_id):
+        owned = db.session.execute(
+            select(Product.id).where(Product.id == product_id, Product.merchant_id == merchant_id)
+        ).scalar()
+        if owned is None:
+            return NOT_FOUND
+        # Orders go with the product, in bulk like the admin delete
+        return self._write(lambda: cascades.delete_product(product_id), 'فشل في حذف المنتج')
+
+    def get_services(self, merchant_id, page=1, limit=20):
+        try:
+            pagination = (
+                Service.query.options(*list_loaders(Service))
+                .join(Store, Service.store_id == Store.id)
+                .filter(Store.merchant_id == merchant_id)
+                .order_by(Service.created_at.desc(), Service.id.desc())
+                .paginate(page=page, per_page=limit, error_out=False)
+            )
+            return {
+                'services': serialize(pagination.items),
+                'total': pagination.total,
+                'pages': pagination.pages,
+                'current_page': page
+            }
+        except Exception as e:
+            logging.error(f"Local services error: {e}")
+            return {'error': 'فشل في جلب الخدمات'}
+
+    def create_service(self, merchant_id, form):
+        fields, error = catalog_fields(form)
+        if error:
+            return {'error': error}
+        store = self._store(merchant_id)
+        if store is None:
+            return NO_STORE
+
+        def create():
+            service = Service(
+                name=fields['name'], description=fields['description'], price=fields['price'],
+                store_id=store.id
+            )
+            db.session.add(service)
+            db.session.flush()
+            return {'id': service.id}
+        return self._write(create, 'فشل في إضافة الخدمة')
+
+    def _owned_service(self, merchant_id, service_id):
+        return (
+            Service.query.join(Store, Service.store_id == Store.id)
+            .filter(Service.id == service_id, Store.merchant_id == merchant_id)
+            .first()
+        )
+
+    def update_service(self, merchant_id, service_id, form):
+        fields, error = catalog_fields(form)
+        if error:
+            return {'error': error}
+        service = self._owned_service(merchant_id, service_id)
+        if service is None:
+            return NOT_FOUND
+
+        def update():
+            service.name = fields['name']
+            service.description = fields['description']
+            service.price = fields['price']
+            return {'id': service.id}
+        return self._write(update, 'فشل في تحديث الخدمة')
+
+    def delete_service(self, merchant_id, service_id):
+        service = self._owned_service(merchant_id, service_id)
+        if service is None:
+            return NOT_FOUND
+
+        def delete():
+            db.session.delete(service)
+            return {'id': service_id}
+        return self._write(delete, 'فشل في حذف الخدمة')
+
+    @staticmethod
+    def _order_view(order):
+        """Order in the API's shape, which the merchant templates render"""
+        data = order.to_dict()
+        data['total_amount'] = data['total_price']
+        data['items'] = [{
+            'name': data['product_name'],
+            'quantity': data['quantity'],
+            'price': data['total_price'],
+        }] if data['product_name'] else []
+        return data
+
+    def get_orders(self, merchant_id, page=1, limit=20):
+        try:
+            pagination = (
+                Order.query.options(*list_loaders(Order))
+                .filter_by(merchant_id=merchant_id)
+                .order_by(Order.created_at.desc(), Order.id.desc())
+                .paginate(page=page, per_page=limit, error_out=False)
+            )
+            return {
+                'orders': [self._order_view(order) for order in pagination.items],
+                'total': pagination.total,
+                'pages': pagination.pages,
+                'current_page': page
+            }
+        except Exception as e:
+            logging.error(f"Local orders error: {e}")
+            return {'error': 'فشل في جلب الطلبات'}
+
+    def update_order_status(self, merchant_id, order_id, status):
+        if status not in ORDER_STATUSES:
+            return {'error': 'حالة الطلب غير صالحة'}
+        order = Order.query.filter_by(id=order_id, merchant_id=merchant_id).first()
+        if order is None:
+            return NOT_FOUND
+
+        def update():
+            order.status = status
+            return {'id': order.id, 'status': status}
+        return self._write(update, 'فشل في تحديث حالة الطلب')
+
+class RemoteBackend:
+    """Forwards every operation to the BaytAlSudani API through APIClient"""
+
+    local = False
+
+    def __init__(self, client):
+        self.client = client
+
+    def _store_id(self, merchant_id):
+        store = self.client.get_merchant_store(merchant_id)
+        if 'error' in store:
+            return None
+        return store.get('store_id', store.get('id'))
+
+    def _catalog_payload(self, merchant_id, form, with_store=True):
+        fields, error = catalog_fields(form)
+        if error:
+            return None, {'error': error}
+        payload = dict(fields, price=float(fields['price']))
+        if with_store:
+            payload['store_id'] = self._store_id(merchant_id)
+            if payload['store_id'] is None:
+                return None, NO_STORE
+        return payload, None
+
+    def get_merchant_store(self, merchant_id):
+        return self.client.get_merchant_store(merchant_id)
+
+    def create_product(self, merchant_id, form):
+        payload, error = self._catalog_payload(merchant_id, form)
+        return error or self.client.create_product(payload)
+
+    def update_product(self, merchant_id, product_id, form):
+        payload, error = self._catalog_payload(merchant_id, form, with_store=False)
+        return error or self.client.update_product(product_id, payload)
+
+    def delete_product(self, merchant_id, product_id):
+        return self.client.delete_product(product_id)
+
+    def get_services(self, merchant_id, page=1, limit=20):
+        return self.client.get_services(page=page, limit=limit, store_id=self._store_id(merchant_id))
+
+    def create_service(self, merchant_id, form):
+        payload, error = self._catalog_payload(merchant_id, form)
+        return error or self.client.create_service(payload)
+
+    def update_service(self, merchant_id, service_id, form):
+        payload, error = self._catalog_payload(merchant_id, form, with_store=False)
+        return error or self.client.update_service(service_id, payload)
+
+    def delete_service(self, merchant_id, service_id):
+        return self.client.delete_service(service_id)
+
+    def get_orders(self, merchant_id, page=1, limit=20):
+        return self.client.get_orders(store_id=self._store_id(merchant_id), page=page, limit=limit)
+
+    def update_order_status(self, merchant_id, order_id, status):
+        return self.client.update_order_status(order_id, status)
+
+BACKENDS = {
+    'local': LocalBackend(),
+    'remote': RemoteBackend(api_client),
+}
+
+def data_backend():
+    """Backend selected by the DATA_BACKEND setting"""
+    return BACKENDS[current_app.config.get('DATA_BACKEND', 'local')]
+
+def local_scopes(*scopes):
+    """Conditional GET scopes of a page, or None when its data comes from the API"""
+    return list(scopes) if data_backend().local else None
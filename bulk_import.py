@@ -0,0 +1,183 @@
+"""
+Bulk catalogue import for BaytAlSudani Admin Dashboard
+Uploaded CSV or XLSX sheets are validated row by row in a single streaming
+pass and inserted in multi-row INSERT batches, collecting per-row errors
+"""
+import csv
+import io
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+from openpyxl import load_workbook
+from sqlalchemy import insert, select
+from models import db, Store, Product, Service
+from counters import add_rows
+
+IMPORT_BATCH_SIZE = 1000
+# Only the first errors are kept for the report; the rest are just counted
+MAX_REPORTED_ERRORS = 200
+
+IMPORTABLE = {
+    'products': Product,
+    'services': Service,
+}
+
+# Accepted column headers, including their Arabic names
+HEADER_ALIASES = {
+    'name': 'name', 'الاسم': 'name',
+    'description': 'description', 'الوصف': 'description',
+    'price': 'price', 'السعر': 'price',
+    'store_id': 'store_id', 'المتجر': 'store_id',
+    'is_active': 'is_active', 'نشط': 'is_active',
+}
+
+_FALSE_VALUES = {'0', 'false', 'no', 'لا'}
+
+@dataclass
+class RowError:
+    """Validation failure of one sheet row"""
+    line: int
+    message: str
+
+@dataclass
+class ImportResult:
+    """Outcome of a bulk import"""
+    inserted: int = 0
+    errors: List[RowError] = field(default_factory=list)
+    error_count: int = 0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, message))
+
+def _csv_rows(stream):
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    try:
+        yield from reader
+    except UnicodeDecodeError:
+        raise ValueError('يجب حفظ ملف CSV بترميز UTF-8')
+
+def _xlsx_rows(stream):
+    # Read-only mode streams rows instead of loading the whole workbook
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ['' if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+def read_sheet(upload):
+    """Rows of an uploaded file as lists of strings, header first"""
+    filename = (upload.filename or '').lower()
+    if filename.endswith('.xlsx'):
+        return _xlsx_rows(upload.stream)
+    if filename.endswith('.csv'):
+        return _csv_rows(upload.stream)
+    raise ValueError('صيغة الملف غير مدعومة، يرجى رفع ملف CSV أو XLSX')
+
+class _StoreLookup:
+    """Owner of each referenced store, queried once per store"""
+
+    def __init__(self, merchant_id=None):
+        self.merchant_id = merchant_id
+        self.owners: Dict[int, Optional[int]] = {}
+
+    def owner(self, store_id):
+        if store_id not in self.owners:
+            query = select(Store.merchant_id).where(Store.id == store_id)
+            if self.merchant_id is not None:
+                query = query.where(Store.merchant_id == self.merchant_id)
+            self.owners[store_id] = db.session.execute(query).scalar()
+        return self.owners[store_id]
+
+def _default_store_id(merchant_id):
+    """A merchant's store when they have exactly one"""
+    if merchant_id is None:
+        return None
+    store_ids = db.session.execute(
+        select(Store.id).where(Store.merchant_id == merchant_id).limit(2)
+    ).scalars().all()
+    return store_ids[0] if len(store_ids) == 1 else None
+
+def _validate(values, stores, default_store_id):
+    """Insertable row for one sheet row, or an error message"""
+    name = (values.get('name') or '').strip()
+    if not name:
+        return None, 'الاسم مطلوب'
+    if len(name) > 100:
+        return None, 'الاسم أطول من 100 حرف'
+
+    try:
+        price = Decimal((values.get('price') or '').strip())
+        if not price.is_finite() or price < 0:
+            raise InvalidOperation()
+    except InvalidOperation:
+        return None, 'السعر يجب أن يكون رقماً موجباً'
+
+    raw_store = (values.get('store_id') or '').strip()
+    if raw_store:
+        try:
+            store_id = int(float(raw_store))
+        except ValueError:
+            return None, 'معرف المتجر غير صالح'
+    elif default_store_id is not None:
+        store_id = default_store_id
+    else:
+        return None, 'المتجر مطلوب'
+
+    merchant_id = stores.owner(store_id)
+    if merchant_id is None:
+        return None, 'المتجر المحدد غير موجود'
+
+    return {
+        'name': name,
+        'description': (values.get('description') or '').strip(),
+        'price': price,
+        'store_id': store_id,
+        'merchant_id': merchant_id,
+        'is_active': (values.get('is_active') or '').strip().lower() not in _FALSE_VALUES,
+    }, None
+
+def _insert_batch(model, batch):
+    if model is Service:
+        batch = [{key: value for key, value in row.items() if key != 'merchant_id'} for row in batch]
+    ids = db.session.execute(
+        insert(model).values(batch).returning(model.id)
+    ).scalars().all()
+    add_rows({model: model.id.in_(ids)})
+    return len(ids)
+
+def import_catalog(kind, rows, merchant_id=None):
+    """Validate and insert products or services; the caller commits"""
+    model = IMPORTABLE[kind]
+    result = ImportResult()
+    rows = iter(rows)
+
+    header = next(rows, None)
+    if header is None:
+        raise ValueError('الملف فارغ')
+    columns = [HEADER_ALIASES.get((title or '').strip().lower()) for title in header]
+    if 'name' not in columns or 'price' not in columns:
+        raise ValueError('يجب أن يحتوي الملف على عمودي الاسم والسعر')
+
+    stores = _StoreLookup(merchant_id)
+    default_store_id = _default_store_id(merchant_id)
+    batch = []
+    # Line numbers match the sheet, where the header is line 1
+    for line, row in enumerate(rows, start=2):
+        if not any((value or '').strip() for value in row):
+            continue
+        values = {column: value for column, value in zip(columns, row) if column}
+        record, error = _validate(values, stores, default_store_id)
+        if error:
+            result.add_error(line, error)
+            continue
+        batch.append(record)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            result.inserted += _insert_batch(model, batch)
+            batch = []
+
+    if batch:
+        result.inserted += _insert_batch(model, batch)
+    return result
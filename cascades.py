@@ -0,0 +1,78 @@
+"""
+Set-based cascading deletes for BaytAlSudani Admin Dashboard
+Children are removed with bulk DELETE ... WHERE statements, bottom-up, so
+nothing is loaded into the session; ON DELETE CASCADE foreign keys back
+this up for anything deleted directly in the database
+"""
+from sqlalchemy import Date, delete, func, or_, select
+from models import db, User, Store, Product, Service, Order, StatsCounter
+from counters import subtract_rows
+from rollups import refresh_days
+from identity import forget_user
+
+# Tables deleted in dependency order, children first
+DELETE_ORDER = (Order, Service, Product, Store, User)
+
+COUNT_KEYS = {
+    Order: 'orders',
+    Service: 'services',
+    Product: 'products',
+    Store: 'stores',
+    User: 'users',
+}
+
+def _bulk_delete(criteria):
+    """Delete every model's matching rows, returning affected row counts"""
+    subtract_rows(criteria)
+    # Deleted orders don't advance the rollup watermark, so their days are redone here
+    order_days = []
+    if Order in criteria:
+        order_days = db.session.execute(
+            select(func.date(Order.created_at, type_=Date)).where(criteria[Order]).distinct()
+        ).scalars().all()
+
+    counts = {}
+    for model in DELETE_ORDER:
+        if model not in criteria:
+            continue
+        result = db.session.execute(
+            delete(model).where(criteria[model]).execution_options(synchronize_session=False)
+        )
+        counts[COUNT_KEYS[model]] = result.rowcount
+    refresh_days(day for day in order_days if day is not None)
+    return counts
+
+def delete_merchant(user_id):
+    """Delete a merchant with all stores, products, services and orders"""
+    store_ids = select(Store.id).where(Store.merchant_id == user_id)
+    product_ids = select(Product.id).where(
+        or_(Product.merchant_id == user_id, Product.store_id.in_(store_ids))
+    )
+    counts = _bulk_delete({
+        Order: or_(Order.merchant_id == user_id, Order.product_id.in_(product_ids)),
+        Service: Service.store_id.in_(store_ids),
+        Product: or_(Product.merchant_id == user_id, Product.store_id.in_(store_ids)),
+        Store: Store.merchant_id == user_id,
+        User: User.id == user_id,
+    })
+    db.session.execute(delete(StatsCounter).where(StatsCounter.merchant_id == user_id))
+    # The bulk delete bypasses the User mapper events
+    forget_user(db.session.connection(), user_id)
+    return counts
+
+def delete_store(store_id):
+    """Delete a store with its products, services and their orders"""
+    product_ids = select(Product.id).where(Product.store_id == store_id)
+    return _bulk_delete({
+        Order: Order.product_id.in_(product_ids),
+        Service: Service.store_id == store_id,
+        Product: Product.store_id == store_id,
+        Store: Store.id == store_id,
+    })
+
+def delete_product(product_id):
+    """Delete a product and its orders"""
+    return _bulk_delete({
+        Order: Order.product_id == product_id,
+        Product: Product.id == product_id,
+    })
@@ -0,0 +1,82 @@
+"""
+Conditional GET for BaytAlSudani Admin Dashboard
+Views declare the rows they render; a single cheap query over max(updated_at)
+and the row count of each scope yields an ETag, and matching If-None-Match
+requests get 304 Not Modified before any page query or template runs
+"""
+import hashlib
+import logging
+from functools import wraps
+from flask import current_app, g, make_response, message_flashed, request, session
+from flask_login import current_user
+from sqlalchemy import func, select, true
+from models import db
+
+@message_flashed.connect
+def _note_flash(app, message, category, **extra):
+    g.flashed = True
+
+def scope(model, *criteria):
+    """Version query of the rows of a model matching the criteria"""
+    return select(
+        func.max(model.updated_at).label('updated_at'),
+        func.count().label('rows')
+    ).select_from(model).where(*criteria)
+
+def version_fingerprint(scopes):
+    """ETag value and newest updated_at across scopes, in one round trip"""
+    subqueries = [query.subquery() for query in scopes]
+    # Every scope yields exactly one row, so they are simply joined side by side
+    versions = subqueries[0]
+    for subquery in subqueries[1:]:
+        versions = versions.join(subquery, true())
+    row = db.session.execute(select(versions)).one()
+
+    digest = hashlib.sha1()
+    # The viewer and deployment are part of the version, since pages differ by user
+    digest.update(repr((
+        current_user.get_id(), current_app.config.get('ETAG_SALT', ''), tuple(row)
+    )).encode())
+    last_modified = max((value for value in row[::2] if value is not None), default=None)
+    return digest.hexdigest(), last_modified
+
+def conditional(scopes_for):
+    """Answer GETs whose If-None-Match matches the scopes' version with 304
+
+    scopes_for returns None when the page renders data these tables do not version.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            # Pending flash messages are rendered once, so such pages are never cached
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            try:
+                scopes = scopes_for(*args, **kwargs)
+                fingerprint = None if scopes is None else version_fingerprint(scopes)
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Version fingerprint error: {e}")
+                fingerprint = None
+            if fingerprint is None:
+                return view(*args, **kwargs)
+            etag, last_modified = fingerprint
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                # Error pages rendered with a flash message must not be revalidated into place
+                if response.status_code != 200 or g.get('flashed'):
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Browsers keep the page but revalidate it on every visit
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapped
+    return decorator
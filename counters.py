@@ -0,0 +1,350 @@
+"""
+Incrementally maintained dashboard counters for BaytAlSudani Admin Dashboard
+Mapper listeners keep the stats_counters table in step with every flush
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import event, func, select, update, delete, inspect, true
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from models import db, User, Store, Product, Service, Order, Advertisement, Job, StatsCounter
+from feed import publish
+
+GLOBAL_SCOPE = 0
+
+_INSERTS = {
+    'postgresql': pg_insert,
+    'sqlite': sqlite_insert,
+}
+
+def _value(target, attr, old):
+    """Current value of an attribute, or its value before this flush"""
+    if old:
+        history = inspect(target).attrs[attr].history
+        if history.deleted:
+            return history.deleted[0]
+    return getattr(target, attr)
+
+def _store_merchant_id(connection, store_id):
+    """Merchant owning a store, read on the flushing connection"""
+    if store_id is None:
+        return None
+    return connection.execute(
+        select(Store.merchant_id).where(Store.id == store_id)
+    ).scalar()
+
+def _user_counters(connection, target, old):
+    role = _value(target, 'role', old)
+    counters = [(GLOBAL_SCOPE, f'{role}s', 1)]
+    if _value(target, 'is_active', old):
+        counters.append((GLOBAL_SCOPE, f'active_{role}s', 1))
+    return counters
+
+def _store_counters(connection, target, old):
+    merchant_id = _value(target, 'merchant_id', old)
+    counters = [(GLOBAL_SCOPE, 'stores', 1), (merchant_id, 'stores', 1)]
+    if _value(target, 'is_active', old):
+        counters += [(GLOBAL_SCOPE, 'active_stores', 1), (merchant_id, 'active_stores', 1)]
+    return counters
+
+def _product_counters(connection, target, old):
+    return [(GLOBAL_SCOPE, 'products', 1), (_value(target, 'merchant_id', old), 'products', 1)]
+
+def _service_counters(connection, target, old):
+    merchant_id = _store_merchant_id(connection, _value(target, 'store_id', old))
+    counters = [(GLOBAL_SCOPE, 'services', 1)]
+    if merchant_id is not None:
+        counters.append((merchant_id, 'services', 1))
+    return counters
+
+def _order_counters(connection, target, old):
+    merchant_id = _value(target, 'merchant_id', old)
+    status = _value(target, 'status', old) or 'pending'
+    counters = []
+    for scope in (GLOBAL_SCOPE, merchant_id):
+        counters += [(scope, 'orders', 1), (scope, f'orders_{status}', 1)]
+        if status == 'delivered':
+            counters.append((scope, 'revenue', _value(target, 'total_price', old) or 0))
+    return counters
+
+def _ad_counters(connection, target, old):
+    return [(GLOBAL_SCOPE, 'ads', 1)]
+
+def _job_counters(connection, target, old):
+    return [(GLOBAL_SCOPE, 'jobs', 1)]
+
+# Contribution of a single row to the counters, and the attributes it reads
+COUNTED_MODELS = {
+    User: (_user_counters, ('role', 'is_active')),
+    Store: (_store_counters, ('merchant_id', 'is_active')),
+    Product: (_product_counters, ('merchant_id',)),
+    Service: (_service_counters, ('store_id',)),
+    Order: (_order_counters, ('merchant_id', 'status', 'total_price')),
+    Advertisement: (_ad_counters, ()),
+    Job: (_job_counters, ()),
+}
+
+# Per-store catalogue size columns kept on the stores table
+STORE_COUNT_COLUMNS = {
+    Product: 'products_count',
+    Service: 'services_count',
+}
+
+_registered = False
+
+def apply_deltas(connection, deltas):
+    """Add deltas keyed by (merchant_id, name) to the counters table"""
+    deltas = {key: value for key, value in deltas.items() if value}
+    if not deltas:
+        return
+    insert = _INSERTS[connection.dialect.name]
+    now = datetime.utcnow()
+    # One multi-row upsert, its rows in key order so concurrent writers lock them alike
+    stmt = insert(StatsCounter.__table__).values([
+        {'merchant_id': merchant_id, 'name': name, 'value': value, 'updated_at': now}
+        for (merchant_id, name), value in sorted(deltas.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['merchant_id', 'name'],
+        set_={'value': StatsCounter.__table__.c.value + stmt.excluded.value,
+              'updated_at': now}
+    )
+    connection.execute(stmt)
+
+    # Live dashboards apply the same deltas in place
+    by_scope = defaultdict(dict)
+    for (merchant_id, name), value in deltas.items():
+        by_scope[merchant_id][name] = float(value)
+    for merchant_id, scope_deltas in by_scope.items():
+        publish(connection, 'counters', merchant_id, {'deltas': scope_deltas})
+
+def _collect(deltas, counters, sign):
+    for merchant_id, name, value in counters:
+        deltas[(merchant_id, name)] += sign * Decimal(str(value))
+
+def _pending(connection):
+    """Deltas gathered on the connection during the current flush"""
+    return connection.info.setdefault('counter_deltas', defaultdict(Decimal))
+
+def _apply_pending(session, flush_context):
+    # Every row of a flush lands in one upsert instead of one per counter
+    deltas = session.connection().info.pop('counter_deltas', None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+def _drop_pending(connection):
+    connection.info.pop('counter_deltas', None)
+
+def _make_listeners(counters_for, attrs):
+    def after_insert(mapper, connection, target):
+        _collect(_pending(connection), counters_for(connection, target, False), 1)
+
+    def after_delete(mapper, connection, target):
+        _collect(_pending(connection), counters_for(connection, target, True), -1)
+
+    def after_update(mapper, connection, target):
+        # Moves the row's contribution from its old state to its new one,
+        # which covers status transitions and is_active toggles
+        state = inspect(target)
+        if not any(state.attrs[attr].history.has_changes() for attr in attrs):
+            return
+        deltas = _pending(connection)
+        _collect(deltas, counters_for(connection, target, True), -1)
+        _collect(deltas, counters_for(connection, target, False), 1)
+
+    return after_insert, after_delete, after_update
+
+def _move_store_services(mapper, connection, target):
+    # Services count for the merchant owning their store, so they follow it to a new merchant
+    if not inspect(target).attrs['merchant_id'].history.has_changes():
+        return
+    services = connection.execute(
+        select(func.count()).select_from(Service).where(Service.store_id == target.id)
+    ).scalar()
+    deltas = _pending(connection)
+    for merchant_id, sign in ((_value(target, 'merchant_id', True), -1), (target.merchant_id, 1)):
+        if merchant_id is not None:
+            _collect(deltas, [(merchant_id, 'services', services)], sign)
+
+def _adjust_store_count(connection, column, store_id, delta):
+    if store_id is None:
+        return
+    stores = Store.__table__
+    connection.execute(
+        update(stores).where(stores.c.id == store_id).values({column: stores.c[column] + delta})
+    )
+
+def _make_store_count_listeners(column):
+    def after_insert(mapper, connection, target):
+        _adjust_store_count(connection, column, target.store_id, 1)
+
+    def after_delete(mapper, connection, target):
+        _adjust_store_count(connection, column, _value(target, 'store_id', True), -1)
+
+    def after_update(mapper, connection, target):
+        history = inspect(target).attrs['store_id'].history
+        if history.has_changes():
+            _adjust_store_count(connection, column, _value(target, 'store_id', True), -1)
+            _adjust_store_count(connection, column, target.store_id, 1)
+
+    return after_insert, after_delete, after_update
+
+def _load_old_value(target, value, oldvalue, initiator):
+    pass
+
+def register_listeners():
+    """Attach counter maintenance to every tracked model"""
+    global _registered
+    if _registered:
+        return
+    for model, (counters_for, attrs) in COUNTED_MODELS.items():
+        after_insert, after_delete, after_update = _make_listeners(counters_for, attrs)
+        event.listen(model, 'after_insert', after_insert)
+        event.listen(model, 'after_delete', after_delete)
+        event.listen(model, 'after_update', after_update)
+        # Assigning to an expired attribute must still record its old value,
+        # or the update listener could not tell what the row counted as before
+        for attr in attrs:
+            event.listen(getattr(model, attr), 'set', _load_old_value, active_history=True)
+    for model, column in STORE_COUNT_COLUMNS.items():
+        after_insert, after_delete, after_update = _make_store_count_listeners(column)
+        event.listen(model, 'after_insert', after_insert)
+        event.listen(model, 'after_delete', after_delete)
+        event.listen(model, 'after_update', after_update)
+    event.listen(Store, 'after_update', _move_store_services)
+    event.listen(Session, 'after_flush', _apply_pending)
+    # A failed flush must not leave its deltas on the pooled connection
+    event.listen(Engine, 'rollback', _drop_pending)
+    _registered = True
+
+def get_counters(merchant_id=GLOBAL_SCOPE):
+    """All counters for one scope as a {name: value} dictionary"""
+    rows = db.session.execute(
+        select(StatsCounter.name, StatsCounter.value).where(StatsCounter.merchant_id == merchant_id)
+    )
+    return {name: value for name, value in rows}
+
+def aggregate_totals(criteria=None):
+    """Counter contributions of the rows matching per-model criteria"""
+    # No criteria counts every row; otherwise only the models in the
+    # mapping are aggregated, restricted to their WHERE clause
+    def where(model):
+        if criteria is None:
+            return true()
+        return criteria.get(model)
+
+    totals = defaultdict(Decimal)
+
+    if where(User) is not None:
+        for role, is_active, count in db.session.execute(
+            select(User.role, User.is_active, func.count()).where(where(User))
+            .group_by(User.role, User.is_active)
+        ):
+            totals[(GLOBAL_SCOPE, f'{role}s')] += count
+            if is_active:
+                totals[(GLOBAL_SCOPE, f'active_{role}s')] += count
+
+    if where(Store) is not None:
+        for merchant_id, total, active in db.session.execute(
+            select(Store.merchant_id, func.count(), func.count().filter(Store.is_active.is_(True)))
+            .where(where(Store)).group_by(Store.merchant_id)
+        ):
+            for scope in (GLOBAL_SCOPE, merchant_id):
+                totals[(scope, 'stores')] += total
+                totals[(scope, 'active_stores')] += active
+
+    if where(Product) is not None:
+        for merchant_id, total in db.session.execute(
+            select(Product.merchant_id, func.count()).where(where(Product))
+            .group_by(Product.merchant_id)
+        ):
+            totals[(GLOBAL_SCOPE, 'products')] += total
+            totals[(merchant_id, 'products')] += total
+
+    if where(Service) is not None:
+        for merchant_id, total in db.session.execute(
+            select(Store.merchant_id, func.count(Service.id))
+            .join(Service, Service.store_id == Store.id)
+            .where(where(Service)).group_by(Store.merchant_id)
+        ):
+            totals[(GLOBAL_SCOPE, 'services')] += total
+            totals[(merchant_id, 'services')] += total
+
+    for model, name in ((Advertisement, 'ads'), (Job, 'jobs')):
+        if where(model) is not None:
+            totals[(GLOBAL_SCOPE, name)] += db.session.scalar(
+                select(func.count()).select_from(model).where(where(model))
+            )
+
+    if where(Order) is not None:
+        for merchant_id, status, total, revenue in db.session.execute(
+            select(Order.merchant_id, Order.status, func.count(),
+                   func.coalesce(func.sum(Order.total_price), 0))
+            .where(where(Order)).group_by(Order.merchant_id, Order.status)
+        ):
+            for scope in (GLOBAL_SCOPE, merchant_id):
+                totals[(scope, 'orders')] += total
+                totals[(scope, f'orders_{status}')] += total
+                if status == 'delivered':
+                    totals[(scope, 'revenue')] += Decimal(revenue)
+
+    return totals
+
+def _shift_rows(criteria, sign):
+    totals = aggregate_totals(criteria)
+    apply_deltas(db.session.connection(), {key: sign * value for key, value in totals.items()})
+
+    stores = Store.__table__
+    for model, column in STORE_COUNT_COLUMNS.items():
+        if model not in criteria:
+            continue
+        for store_id, total in db.session.execute(
+            select(model.store_id, func.count()).where(criteria[model]).group_by(model.store_id)
+        ).all():
+            db.session.execute(
+                update(stores).where(stores.c.id == store_id).values({column: stores.c[column] + sign * total})
+            )
+
+def subtract_rows(criteria):
+    """Take rows about to be removed by bulk DELETE statements out of the counters"""
+    # Bulk deletes bypass the mapper listeners, so callers run this first
+    # with the same per-model WHERE clauses they are about to delete by
+    _shift_rows(criteria, -1)
+
+def add_rows(criteria):
+    """Count rows just created by bulk INSERT statements, which bypass the listeners"""
+    _shift_rows(criteria, 1)
+
+def rebuild_counters():
+    """Recompute every counter from scratch with grouped aggregate queries"""
+    totals = aggregate_totals()
+
+    stores = Store.__table__
+    for model, column in STORE_COUNT_COLUMNS.items():
+        db.session.execute(update(stores).values({
+            column: select(func.count()).select_from(model.__table__)
+            .where(model.__table__.c.store_id == stores.c.id).scalar_subquery()
+        }))
+
+    db.session.execute(delete(StatsCounter))
+    now = datetime.utcnow()
+    db.session.add_all(
+        StatsCounter(merchant_id=merchant_id, name=name, value=value, updated_at=now)
+        for (merchant_id, name), value in totals.items() if value
+    )
+    db.session.commit()
+    return len(totals)
+
+def init_counters():
+    """Build the counters once when the table is empty but data exists"""
+    try:
+        if StatsCounter.query.first() is None and User.query.first() is not None:
+            rebuild_counters()
+    except Exception as e:
+        # Another instance building them at the same time must not fail this boot
+        db.session.rollback()
+        logging.error(f"Counter initialization error: {e}")
@@ -0,0 +1,151 @@
+"""
+Streaming data exports for BaytAlSudani Admin Dashboard
+Rows are read through a server-side cursor in fixed-size batches and
+written straight to the response, so memory stays flat at any export size
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+from flask import Response, stream_with_context
+from sqlalchemy import select
+from models import db, User, Store, Product, Order
+from stats import ORDER_STATUSES
+
+EXPORT_BATCH_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+@dataclass
+class ExportFilters:
+    """Filters shared by every export"""
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    status: Optional[str] = None
+    merchant_id: Optional[int] = None
+
+    @classmethod
+    def from_args(cls, args):
+        """Parse filters from query arguments, raising ValueError on bad input"""
+        def parse_date(name):
+            value = args.get(name)
+            return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+        return cls(
+            date_from=parse_date('from'),
+            date_to=parse_date('to'),
+            status=args.get('status') or None,
+            merchant_id=args.get('merchant_id', type=int)
+        )
+
+def _orders_statement():
+    return (
+        select(
+            Order.id, Order.created_at, Order.status, Order.quantity, Order.total_price,
+            Order.product_id, Product.name.label('product_name'),
+            Order.merchant_id, User.username.label('merchant_name'),
+            Order.customer_name, Order.customer_phone, Order.customer_address
+        )
+        .outerjoin(Product, Order.product_id == Product.id)
+        .outerjoin(User, Order.merchant_id == User.id)
+    )
+
+def _products_statement():
+    return (
+        select(
+            Product.id, Product.created_at, Product.name, Product.price, Product.is_active,
+            Product.store_id, Store.name.label('store_name'),
+            Product.merchant_id, User.username.label('merchant_name')
+        )
+        .outerjoin(Store, Product.store_id == Store.id)
+        .outerjoin(User, Product.merchant_id == User.id)
+    )
+
+def _users_statement():
+    return select(User.id, User.created_at, User.username, User.email, User.role, User.is_active)
+
+# Base statement, status filter and merchant column of each export
+EXPORTS = {
+    'orders': (Order, _orders_statement, lambda status: Order.status == status, Order.merchant_id),
+    'products': (Product, _products_statement, lambda status: Product.is_active == (status == 'active'), Product.merchant_id),
+    'users': (User, _users_statement, lambda status: User.is_active == (status == 'active'), User.id),
+}
+
+def export_statement(kind, filters):
+    """Filtered select for an export, in primary key order"""
+    model, build, status_clause, merchant_column = EXPORTS[kind]
+    statement = build()
+    if filters.date_from:
+        statement = statement.where(model.created_at >= filters.date_from)
+    if filters.date_to:
+        statement = statement.where(model.created_at < filters.date_to + timedelta(days=1))
+    if filters.status:
+        valid = ORDER_STATUSES if model is Order else ('active', 'inactive')
+        if filters.status not in valid:
+            raise ValueError(f"Unknown status: {filters.status}")
+        statement = statement.where(status_clause(filters.status))
+    if filters.merchant_id is not None:
+        statement = statement.where(merchant_column == filters.merchant_id)
+    return statement.order_by(model.id)
+
+def _plain(value):
+    # Amounts keep their exact digits (12.50, not 12.5) instead of going through binary floats
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _csv_chunks(columns, partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # The BOM lets spreadsheet applications detect UTF-8 for Arabic text
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    for rows in partitions:
+        writer.writerows([_plain(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _ndjson_chunks(columns, partitions):
+    for rows in partitions:
+        yield ''.join(
+            json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False) + '\n'
+            for row in rows
+        )
+
+def stream_rows(statement, fmt):
+    """Yield encoded export chunks, one per fetched batch"""
+    with db.engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_SIZE
+        ).execute(statement)
+        columns = list(result.keys())
+        chunks = _csv_chunks if fmt == 'csv' else _ndjson_chunks
+        for chunk in chunks(columns, result.partitions()):
+            yield chunk
+
+def export_response(kind, filters, fmt='csv'):
+    """Streaming download response for an export"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    statement = export_statement(kind, filters)
+    filename = f"{kind}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    return Response(
+        stream_with_context(stream_rows(statement, fmt)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}',
+            # Keep reverse proxies from buffering the whole export
+            'X-Accel-Buffering': 'no',
+        }
+    )
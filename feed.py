@@ -0,0 +1,217 @@
+"""
+Live event feed for BaytAlSudani Admin Dashboard
+Order changes and counter deltas are published inside the writing
+transaction (PostgreSQL NOTIFY, delivered on commit) and fanned out by one
+listener thread per process to Server-Sent Events subscribers
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+import uuid
+from flask import Response
+from sqlalchemy import event, func, inspect
+from sqlalchemy import select as sql_select
+from sqlalchemy.engine import Engine
+from models import Order
+
+FEED_CHANNEL = 'bayt_events'
+FEED_QUEUE_SIZE = 256
+# Delay before the listener reconnects after losing its connection
+LISTEN_RETRY_SECONDS = 5
+
+_registered = False
+
+class Subscriber:
+    """One open event stream and the events queued for it"""
+
+    def __init__(self, scope, sees_all=False):
+        self.scope = scope
+        self.sees_all = sees_all
+        self.events = queue.Queue(maxsize=FEED_QUEUE_SIZE)
+
+    def wants(self, event):
+        # Counter deltas only ever concern the subscriber's own scope, while
+        # admins see every merchant's order events
+        if event['type'] == 'counters':
+            return event['merchant_id'] == self.scope
+        return self.sees_all or event['merchant_id'] == self.scope
+
+    def offer(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # A stalled client missed events; it reloads once it catches up
+            with self.events.mutex:
+                self.events.queue.clear()
+            self.events.put_nowait({'type': 'resync', 'merchant_id': self.scope, 'data': {}})
+
+class Broadcaster:
+    """Fans published events out to the subscribers of this process"""
+
+    def __init__(self, max_streams=0):
+        self.subscribers = set()
+        self.handlers = {}
+        self.lock = threading.Lock()
+        self.listener = None
+        self.max_streams = max_streams
+
+    def subscribe(self, scope, sees_all=False):
+        """New subscriber, or None when the worker already holds its maximum of streams"""
+        subscriber = Subscriber(scope, sees_all)
+        with self.lock:
+            # Every stream holds a request thread, so some are always left for pages
+            if self.max_streams and len(self.subscribers) >= self.max_streams:
+                return None
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def on(self, event_type, handler):
+        """Handle an internal event type in-process instead of streaming it"""
+        with self.lock:
+            self.handlers.setdefault(event_type, []).append(handler)
+
+    def _handle(self, event):
+        for handler in self.handlers.get(event['type'], ()):
+            try:
+                handler(event)
+            except Exception as e:
+                logging.error(f"Live feed handler error: {e}")
+
+    def dispatch(self, event):
+        if event['type'] in self.handlers:
+            self._handle(event)
+            return
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            if subscriber.wants(event):
+                subscriber.offer(event)
+
+    def ensure_listening(self, engine):
+        """Start the NOTIFY listener thread once per process"""
+        if engine.dialect.name != 'postgresql':
+            return
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(
+                    target=self._listen, args=(engine,), name='feed-listener', daemon=True
+                )
+                self.listener.start()
+
+    def _listen(self, engine):
+        while True:
+            try:
+                raw = engine.raw_connection()
+                # The LISTEN connection lives for the whole process, outside the pool
+                raw.detach()
+                connection = raw.driver_connection
+                connection.autocommit = True
+                connection.cursor().execute(f'LISTEN {FEED_CHANNEL}')
+                while True:
+                    if select.select([connection], [], [], 60) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self.dispatch(json.loads(connection.notifies.pop(0).payload))
+            except Exception as e:
+                logging.error(f"Live feed listener error: {e}")
+                # Events were lost while disconnected, so handlers reset and every client resyncs
+                self._handle({'type': 'reconnect', 'merchant_id': None, 'data': {}})
+                for subscriber in list(self.subscribers):
+                    subscriber.offer({'type': 'resync', 'merchant_id': subscriber.scope, 'data': {}})
+                time.sleep(LISTEN_RETRY_SECONDS)
+
+broadcaster = Broadcaster()
+
+def publish(connection, event_type, merchant_id, data):
+    """Publish an event that subscribers receive once the transaction commits"""
+    # The id also keeps NOTIFY from folding identical payloads of one transaction
+    event = {'id': uuid.uuid4().hex, 'type': event_type, 'merchant_id': merchant_id, 'data': data}
+    if connection.dialect.name == 'postgresql':
+        connection.execute(sql_select(func.pg_notify(FEED_CHANNEL, json.dumps(event, default=str))))
+    else:
+        connection.info.setdefault('feed_pending', []).append(event)
+
+@event.listens_for(Engine, 'commit')
+def _dispatch_pending(connection):
+    # In-process delivery for databases without NOTIFY
+    for pending in connection.info.pop('feed_pending', []):
+        broadcaster.dispatch(json.loads(json.dumps(pending, default=str)))
+
+@event.listens_for(Engine, 'rollback')
+def _drop_pending(connection):
+    connection.info.pop('feed_pending', None)
+
+def _order_created(mapper, connection, target):
+    publish(connection, 'order_created', target.merchant_id, {
+        'id': target.id,
+        'status': target.status,
+        'total_price': float(target.total_price or 0),
+        'customer_name': target.customer_name,
+        'created_at': target.created_at.isoformat() if target.created_at else None,
+    })
+
+def _order_updated(mapper, connection, target):
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+    publish(connection, 'order_status', target.merchant_id, {
+        'id': target.id,
+        'status': target.status,
+        'previous': history.deleted[0] if history.deleted else None,
+    })
+
+def register_listeners():
+    """Publish order events from every flush"""
+    global _registered
+    if _registered:
+        return
+    event.listen(Order, 'after_insert', _order_created)
+    event.listen(Order, 'after_update', _order_updated)
+    # Keep the previous status even when it was expired before the change
+    event.listen(Order.status, 'set', lambda target, value, oldvalue, initiator: None, active_history=True)
+    _registered = True
+
+def _format(event):
+    return f"id: {event.get('id', '')}\nevent: {event['type']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+def _stream(subscriber, heartbeat, max_seconds):
+    # Clients reconnect shortly after the stream is recycled
+    yield 'retry: 3000\n\n'
+    deadline = time.monotonic() + max_seconds
+    while time.monotonic() < deadline:
+        try:
+            event = subscriber.events.get(timeout=heartbeat)
+        except queue.Empty:
+            # A client that went away is only noticed when a write fails
+            yield ': keepalive\n\n'
+            continue
+        yield _format(event)
+
+def feed_response(engine, scope, sees_all, heartbeat=25, max_seconds=300):
+    """Server-Sent Events response streaming a scope's events, 503 when the worker has no stream to spare"""
+    broadcaster.ensure_listening(engine)
+    subscriber = broadcaster.subscribe(scope, sees_all)
+    if subscriber is None:
+        # EventSource gives up on a 503, so the page just stays without live updates
+        return Response('', status=503, headers={'Retry-After': str(max_seconds)})
+    # The generator runs without an app context, so the request's database
+    # session is released as soon as the view returns
+    response = Response(
+        _stream(subscriber, heartbeat, max_seconds),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        }
+    )
+    # Runs even when the stream is closed before its first event
+    response.call_on_close(lambda: broadcaster.unsubscribe(subscriber))
+    return response
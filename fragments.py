@@ -0,0 +1,17 @@
+"""
+HTML fragments for BaytAlSudani Admin Dashboard
+List and dashboard views render only their table or stats partial when
+asked with ?fragment=1, so pagination and live updates swap that element
+in place instead of reloading the whole page
+"""
+from flask import render_template, request
+
+def wants_fragment():
+    """Whether the request asks for the page's fragment only"""
+    return request.args.get('fragment') == '1'
+
+def render_page(template, fragment, **context):
+    """Render the fragment template when requested, otherwise the full page"""
+    if wants_fragment():
+        return render_template(fragment, **context)
+    return render_template(template, **context)
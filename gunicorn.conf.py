@@ -0,0 +1,28 @@
+"""
+Gunicorn settings for BaytAlSudani Admin Dashboard
+Sizes the threaded workers so live feed streams cannot take every
+request thread, gives the workers a shared Prometheus multiprocess
+directory, emptied at startup, and drops the live gauges of workers that exit
+"""
+import os
+import shutil
+import tempfile
+from prometheus_client import multiprocess
+
+# Each live feed stream holds one thread until its tab is hidden or closed; with
+# FEED_MAX_STREAMS per worker (8 by default) half of every worker stays free for pages
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+
+multiproc_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'bayt-metrics')
+)
+
+def on_starting(server):
+    # Files left by a previous run would be counted again
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,119 @@
+"""
+Identity cache for BaytAlSudani Admin Dashboard
+Flask-Login reloads the signed-in user on every request; detached
+snapshots of users are kept in a per-worker LRU with a TTL, and any change
+to a user evicts its entry in every worker once the change commits
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event
+from models import db, User
+from feed import broadcaster, publish
+
+_registered = False
+
+class CachedUser(UserMixin):
+    """Read-only snapshot of a user, safe to share between requests"""
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.role = user.role
+        self.active = bool(user.is_active)
+
+    @property
+    def is_active(self):
+        return self.active
+
+    def is_admin(self):
+        """Check if user is admin"""
+        return self.role == 'admin'
+
+    def is_merchant(self):
+        """Check if user is merchant"""
+        return self.role == 'merchant'
+
+class IdentityCache:
+    """Thread-safe LRU of user snapshots expiring after a TTL"""
+
+    def __init__(self, size=1024, ttl=60):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def configure(self, size, ttl):
+        with self.lock:
+            self.size = size
+            self.ttl = ttl
+            self.entries.clear()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return user
+
+    def put(self, user):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[user.id] = (user, time.monotonic() + self.ttl)
+            self.entries.move_to_end(user.id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+identity_cache = IdentityCache()
+
+def load_identity(user_id):
+    """Signed-in user for Flask-Login, from the cache when possible"""
+    user_id = int(user_id)
+    cached = identity_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    # Evictions from other workers arrive over the feed listener
+    broadcaster.ensure_listening(db.engine)
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    cached = CachedUser(user)
+    identity_cache.put(cached)
+    return cached
+
+def forget_user(connection, user_id):
+    """Evict a user here now, and in every worker once the transaction commits"""
+    identity_cache.evict(user_id)
+    publish(connection, 'user_changed', None, {'id': user_id})
+
+def _user_changed(mapper, connection, target):
+    forget_user(connection, target.id)
+
+def register_listeners():
+    """Evict users changed through the ORM and drop everything on feed reconnects"""
+    global _registered
+    if _registered:
+        return
+    event.listen(User, 'after_update', _user_changed)
+    event.listen(User, 'after_delete', _user_changed)
+    broadcaster.on('user_changed', lambda event: identity_cache.evict(event['data']['id']))
+    # Evictions may have been missed while the listener was disconnected
+    broadcaster.on('reconnect', lambda event: identity_cache.clear())
+    _registered = True
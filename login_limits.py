@@ -0,0 +1,104 @@
+"""
+Login admission control for BaytAlSudani Admin Dashboard
+Failed logins are counted per username and per client address in a
+per-worker sliding window, and only a few password checks run at once
+per worker, so login floods are turned away before any hashing work
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+class LoginThrottled(Exception):
+    """Raised when a login attempt is refused before checking the password"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+class FailureWindow:
+    """Timestamps of recent failures per key, bounded in keys and age"""
+
+    def __init__(self, limit, window, max_keys=10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.failures = OrderedDict()
+
+    def _recent(self, key, now):
+        attempts = self.failures.get(key)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        if not attempts:
+            del self.failures[key]
+            return None
+        return attempts
+
+    def retry_after(self, key, now):
+        """Seconds until the key may try again, or 0 when it is not blocked"""
+        attempts = self._recent(key, now)
+        if attempts is None or len(attempts) < self.limit:
+            return 0
+        return attempts[-self.limit] + self.window - now
+
+    def record(self, key, now):
+        attempts = self._recent(key, now) or deque(maxlen=self.limit)
+        attempts.append(now)
+        self.failures[key] = attempts
+        self.failures.move_to_end(key)
+        while len(self.failures) > self.max_keys:
+            self.failures.popitem(last=False)
+
+    def reset(self, key):
+        self.failures.pop(key, None)
+
+class LoginLimiter:
+    """Per-username and per-address failure limits plus a cap on concurrent checks"""
+
+    def __init__(self, per_user=5, per_address=20, window=300, concurrency=2, queue_timeout=2):
+        self.lock = threading.Lock()
+        self.configure(per_user, per_address, window, concurrency, queue_timeout)
+
+    def configure(self, per_user, per_address, window, concurrency, queue_timeout):
+        with self.lock:
+            self.users = FailureWindow(per_user, window)
+            self.addresses = FailureWindow(per_address, window)
+            self.slots = threading.BoundedSemaphore(concurrency)
+            self.queue_timeout = queue_timeout
+
+    def check(self, username, address):
+        """Raise LoginThrottled when the username or address is locked out"""
+        now = time.monotonic()
+        with self.lock:
+            wait = max(
+                self.users.retry_after(username.strip().lower(), now),
+                self.addresses.retry_after(address, now)
+            )
+        if wait > 0:
+            raise LoginThrottled('محاولات دخول كثيرة، يرجى المحاولة لاحقاً', int(wait) + 1)
+
+    def failed(self, username, address):
+        now = time.monotonic()
+        with self.lock:
+            self.users.record(username.strip().lower(), now)
+            self.addresses.record(address, now)
+
+    def succeeded(self, username):
+        with self.lock:
+            self.users.reset(username.strip().lower())
+
+    @contextmanager
+    def admission(self):
+        """Hold one of the worker's password-check slots, or refuse the login"""
+        slots = self.slots
+        if not slots.acquire(timeout=self.queue_timeout):
+            raise LoginThrottled('الخادم مشغول حالياً، يرجى المحاولة بعد قليل', 1)
+        try:
+            yield
+        finally:
+            slots.release()
+
+login_limiter = LoginLimiter()
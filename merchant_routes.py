@@ -1,9 +1,22 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_user, logout_user, current_user
-from models import db, User, Store, Product, Service, Order
-from auth import merchant_required, is_merchant_logged_in, authenticate_user
-from sqlalchemy import func, desc
-from decimal import Decimal
+from models import db, Store, Product, Service, Order
+from auth import merchant_required, is_merchant_logged_in, throttled_authenticate
+from login_limits import LoginThrottled
+from stats import get_merchant_stats, MerchantStats
+from serializers import list_loaders, serialize
+from pagination import paginate_list
+from search import search_catalog
+from exports import ExportFilters, export_response
+from bulk_import import IMPORTABLE, import_catalog, read_sheet
+from rollups import CHART_RANGES, order_timeseries
+from feed import feed_response
+import tasks
+from conditional import conditional, scope
+from fragments import render_page, wants_fragment
+from backend import data_backend, local_scopes
+from api_client import api_client
+from sqlalchemy import desc, select
 import logging
 
 merchant_bp = Blueprint('merchant', __name__)
@@ -22,8 +35,12 @@ def login():
             flash('يرجى إدخال البريد الإلكتروني أو اسم المستخدم وكلمة المرور', 'error')
             return render_template('merchant/login.html')
         
-        # Authenticate with database
-        user = authenticate_user(email_or_username, password, 'merchant')
+        # Authenticate with database, refusing floods before any password hashing
+        try:
+            user = throttled_authenticate(email_or_username, password, 'merchant')
+        except LoginThrottled as e:
+            flash(e.message, 'error')
+            return render_template('merchant/login.html'), 429, {'Retry-After': str(e.retry_after)}
         
         if not user:
             flash('البريد الإلكتروني أو كلمة المرور غير صحيحة', 'error')
@@ -65,15 +82,14 @@ def dashboard():
             db.session.commit()
         
         # Get statistics
-        stats = {
-            'products_count': Product.query.filter_by(merchant_id=merchant.id).count(),
-            'services_count': Service.query.filter_by(store_id=store.id).count(),
-            'orders_count': Order.query.filter_by(merchant_id=merchant.id).count(),
-            'pending_orders': Order.query.filter_by(merchant_id=merchant.id, status='pending').count(),
-            'total_revenue': db.session.query(func.sum(Order.total_price)).filter_by(
-                merchant_id=merchant.id, status='delivered'
-            ).scalar() or 0
-        }
+        stats = get_merchant_stats(merchant.id).to_dict()
+        # Subscriptions live in the API whichever backend serves the catalog,
+        # so the page has no local version to answer conditional GETs with
+        subscription = api_client.get_subscription(merchant.id)
+        if 'error' in subscription:
+            subscription = {}
+        if wants_fragment():
+            return render_template('merchant/_dashboard_stats.html', stats=stats, subscription=subscription)
         
         # Get recent orders
         recent_orders = Order.query.filter_by(merchant_id=merchant.id).order_by(
@@ -88,13 +104,43 @@ def dashboard():
         return render_template('merchant/dashboard.html',
                              store=store,
                              stats=stats,
+                             subscription=subscription,
                              recent_orders=recent_orders,
-                             recent_products=recent_products)
+                             recent_products=recent_products,
+                             chart_ranges=CHART_RANGES)
     except Exception as e:
         flash('فشل في تحميل لوحة التحكم', 'error')
         logging.error(f"Merchant dashboard error: {e}")
         return render_template('merchant/dashboard.html', 
-                             store=None, stats={}, recent_orders=[], recent_products=[])
+                             store=None, stats=MerchantStats().to_dict(), subscription={}, recent_orders=[], recent_products=[],
+                             chart_ranges=CHART_RANGES)
+
+@merchant_bp.route('/stats/orders')
+@merchant_required
+def order_stats():
+    """Daily orders and revenue of the merchant from the rollup table"""
+    days = request.args.get('days', CHART_RANGES[1], type=int)
+    if days not in CHART_RANGES:
+        days = CHART_RANGES[1]
+    
+    try:
+        # Refreshed by a background task; the chart shows the rollups as they stand
+        tasks.refresh_rollups_if_stale()
+        return jsonify({'days': days, 'series': order_timeseries(days, merchant_id=current_user.id)})
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Merchant order stats error: {e}")
+        return jsonify({'error': 'فشل في تحميل الإحصائيات', 'days': days, 'series': []}), 500
+
+@merchant_bp.route('/live')
+@merchant_required
+def live_feed():
+    """Server-Sent Events feed of the merchant's orders and counters"""
+    return feed_response(
+        db.engine, current_user.id, sees_all=False,
+        heartbeat=current_app.config['FEED_HEARTBEAT'],
+        max_seconds=current_app.config['FEED_MAX_STREAM_SECONDS']
+    )
 
 @merchant_bp.route('/store-profile', methods=['GET', 'POST'])
 @merchant_required
@@ -131,51 +177,111 @@ def store_profile():
 
 @merchant_bp.route('/products')
 @merchant_required
+@conditional(lambda: [
+    scope(Product, Product.merchant_id == current_user.id),
+    scope(Store, Store.merchant_id == current_user.id),
+])
 def products():
     """Merchant products management"""
     try:
         merchant = current_user
-        page = request.args.get('page', 1, type=int)
         per_page = 20
         
         # Get products with pagination
-        products_pagination = Product.query.filter_by(merchant_id=merchant.id).paginate(
-            page=page, per_page=per_page, error_out=False
+        products_page = paginate_list(
+            Product.query.options(*list_loaders(Product)).filter_by(merchant_id=merchant.id),
+            Product, per_page
         )
         
-        products_list = [product.to_dict() for product in products_pagination.items]
+        products_list = serialize(products_page.items)
         
-        return render_template('merchant/products.html',
+        return render_page('merchant/products.html', 'merchant/_products_list.html',
                              products=products_list,
-                             current_page=page,
-                             total_pages=products_pagination.pages,
-                             total_products=products_pagination.total,
-                             has_prev=products_pagination.has_prev,
-                             has_next=products_pagination.has_next,
-                             prev_num=products_pagination.prev_num,
-                             next_num=products_pagination.next_num)
+                             total_products=products_page.total,
+                             **products_page.template_args())
     except Exception as e:
         flash('فشل في تحميل المنتجات', 'error')
         logging.error(f"Products page error: {e}")
-        return render_template('merchant/products.html', 
+        return render_page('merchant/products.html', 'merchant/_products_list.html', 
                              products=[], current_page=1, total_pages=0, total_products=0)
 
+@merchant_bp.route('/search')
+@merchant_required
+def search():
+    """Full-text search over the merchant's products and services"""
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('type', 'products')
+    if kind not in ('products', 'services'):
+        kind = 'products'
+    
+    results = []
+    try:
+        if query:
+            results = serialize(search_catalog(kind, query, limit=50, merchant_id=current_user.id))
+    except Exception as e:
+        flash('فشل في البحث', 'error')
+        logging.error(f"Merchant search error: {e}")
+    
+    return render_template('merchant/search.html', query=query, kind=kind, results=results)
+
+@merchant_bp.route('/export/<kind>')
+@merchant_required
+def export(kind):
+    """Stream the merchant's orders or products as CSV or NDJSON"""
+    list_pages = {'orders': 'merchant.orders', 'products': 'merchant.products'}
+    if kind not in list_pages:
+        flash('نوع التصدير غير مدعوم', 'error')
+        return redirect(url_for('merchant.dashboard'))
+    
+    try:
+        filters = ExportFilters.from_args(request.args)
+        # Merchants only ever export their own rows
+        filters.merchant_id = current_user.id
+        return export_response(kind, filters, request.args.get('format', 'csv'))
+    except ValueError as e:
+        flash('معايير التصدير غير صالحة', 'error')
+        logging.error(f"Merchant export {kind} error: {e}")
+        return redirect(url_for(list_pages[kind]))
+
+@merchant_bp.route('/import', methods=['GET', 'POST'])
+@merchant_required
+def bulk_import():
+    """Bulk import products or services into the merchant's stores"""
+    kind = request.values.get('type', 'products')
+    if kind not in IMPORTABLE:
+        kind = 'products'
+    
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('يرجى اختيار ملف للرفع', 'error')
+            return render_template('merchant/import.html', kind=kind, result=None)
+        
+        try:
+            result = import_catalog(kind, read_sheet(upload), merchant_id=current_user.id)
+            db.session.commit()
+            
+            if result.error_count:
+                flash(f'تم استيراد {result.inserted} صفاً، وتعذر استيراد {result.error_count} صفاً', 'warning')
+            else:
+                flash(f'تم استيراد {result.inserted} صفاً بنجاح', 'success')
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'error')
+        except Exception as e:
+            db.session.rollback()
+            flash('حدث خطأ أثناء استيراد الملف', 'error')
+            logging.error(f"Merchant bulk import error: {e}")
+    
+    return render_template('merchant/import.html', kind=kind, result=result)
+
 @merchant_bp.route('/products/add', methods=['GET', 'POST'])
 @merchant_required
 def add_product():
     """Add new product"""
-    merchant = get_current_merchant()
-    
     if request.method == 'POST':
-        product_data = {
-            'name': request.form.get('name'),
-            'description': request.form.get('description'),
-            'price': float(request.form.get('price', 0)),
-            'category': request.form.get('category'),
-            'store_id': merchant['store_id']
-        }
-        
-        result = api_client.create_product(product_data)
+        result = data_backend().create_product(current_user.id, request.form)
         
         if 'error' in result:
             flash(result['error'], 'error')
@@ -189,14 +295,7 @@ def add_product():
 @merchant_required
 def edit_product(product_id):
     """Edit product"""
-    product_data = {
-        'name': request.form.get('name'),
-        'description': request.form.get('description'),
-        'price': float(request.form.get('price', 0)),
-        'category': request.form.get('category')
-    }
-    
-    result = api_client.update_product(product_id, product_data)
+    result = data_backend().update_product(current_user.id, product_id, request.form)
     
     if 'error' in result:
         flash(result['error'], 'error')
@@ -209,7 +308,7 @@ def edit_product(product_id):
 @merchant_required
 def delete_product(product_id):
     """Delete product"""
-    result = api_client.delete_product(product_id)
+    result = data_backend().delete_product(current_user.id, product_id)
     
     if 'error' in result:
         flash(result['error'], 'error')
@@ -220,12 +319,15 @@ def delete_product(product_id):
 
 @merchant_bp.route('/services')
 @merchant_required
+@conditional(lambda: local_scopes(
+    scope(Service, Service.store_id.in_(select(Store.id).where(Store.merchant_id == current_user.id))),
+    scope(Store, Store.merchant_id == current_user.id),
+))
 def services():
     """Merchant services management"""
-    merchant = get_current_merchant()
     page = request.args.get('page', 1, type=int)
     
-    services_data = api_client.get_services(page=page, store_id=merchant['store_id'])
+    services_data = data_backend().get_services(current_user.id, page=page)
     
     if 'error' in services_data:
         flash('فشل في تحميل الخدمات', 'error')
@@ -241,22 +343,25 @@ def services():
 @merchant_required
 def add_service():
     """Add new service"""
-    merchant = get_current_merchant()
+    result = data_backend().create_service(current_user.id, request.form)
     
-    service_data = {
-        'name': request.form.get('name'),
-        'description': request.form.get('description'),
-        'price': float(request.form.get('price', 0)),
-        'category': request.form.get('category'),
-        'store_id': merchant['store_id']
-    }
+    if 'error' in result:
+        flash(result['error'], 'error')
+    else:
+        flash('تم إضافة الخدمة بنجاح', 'success')
     
-    result = api_client.create_service(service_data)
+    return redirect(url_for('merchant.services'))
+
+@merchant_bp.route('/services/<int:service_id>/edit', methods=['POST'])
+@merchant_required
+def edit_service(service_id):
+    """Edit service"""
+    result = data_backend().update_service(current_user.id, service_id, request.form)
     
     if 'error' in result:
         flash(result['error'], 'error')
     else:
-        flash('تم إضافة الخدمة بنجاح', 'success')
+        flash('تم تحديث الخدمة بنجاح', 'success')
     
     return redirect(url_for('merchant.services'))
 
@@ -264,7 +369,7 @@ def add_service():
 @merchant_required
 def delete_service(service_id):
     """Delete service"""
-    result = api_client.delete_service(service_id)
+    result = data_backend().delete_service(current_user.id, service_id)
     
     if 'error' in result:
         flash(result['error'], 'error')
@@ -275,18 +380,18 @@ def delete_service(service_id):
 
 @merchant_bp.route('/orders')
 @merchant_required
+@conditional(lambda: local_scopes(scope(Order, Order.merchant_id == current_user.id)))
 def orders():
     """Merchant orders management"""
-    merchant = get_current_merchant()
     page = request.args.get('page', 1, type=int)
     
-    orders_data = api_client.get_orders(store_id=merchant['store_id'], page=page)
+    orders_data = data_backend().get_orders(current_user.id, page=page)
     
     if 'error' in orders_data:
         flash('فشل في تحميل الطلبات', 'error')
         orders_data = {'orders': [], 'total': 0, 'pages': 0}
     
-    return render_template('merchant/orders.html',
+    return render_page('merchant/orders.html', 'merchant/_orders_list.html',
                          orders=orders_data.get('orders', []),
                          current_page=page,
                          total_pages=orders_data.get('pages', 0),
@@ -298,7 +403,7 @@ def update_order_status(order_id):
     """Update order status"""
     status = request.form.get('status')
     
-    result = api_client.update_order_status(order_id, status)
+    result = data_backend().update_order_status(current_user.id, order_id, status)
     
     if 'error' in result:
         flash(result['error'], 'error')
@@ -311,12 +416,12 @@ def update_order_status(order_id):
 @merchant_required
 def subscription():
     """Merchant subscription management"""
-    merchant = get_current_merchant()
-    
-    subscription_result = api_client.get_subscription(merchant['id'])
+    # Both calls are independent, so they run concurrently instead of back to back
+    subscription_result, history_result = api_client.gather(
+        ('get_subscription', current_user.id),
+        ('get_subscription_history', current_user.id)
+    )
     subscription_data = subscription_result if 'error' not in subscription_result else {}
-    
-    history_result = api_client.get_subscription_history(merchant['id'])
     history_data = history_result.get('history', []) if 'error' not in history_result else []
     
     return render_template('merchant/subscription.html',
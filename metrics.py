@@ -0,0 +1,89 @@
+"""
+Prometheus metrics for BaytAlSudani Admin Dashboard
+Request latency, database pool usage, remote API calls and password
+hashing time are recorded per worker; with PROMETHEUS_MULTIPROC_DIR set
+(see gunicorn.conf.py) /metrics aggregates the files of every worker
+"""
+import os
+import time
+import prometheus_client
+from prometheus_client import multiprocess
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+from api_resilience import CircuitOpen, endpoint_key
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+REQUEST_LATENCY = prometheus_client.Histogram(
+    'http_request_duration_seconds', 'Time to produce a response',
+    ('blueprint', 'endpoint', 'method', 'status')
+)
+# Gauges are summed over the live workers
+POOL_CHECKED_OUT = prometheus_client.Gauge(
+    'db_pool_checked_out', 'Database connections in use', multiprocess_mode='livesum'
+)
+POOL_OVERFLOW = prometheus_client.Gauge(
+    'db_pool_overflow', 'Connections open beyond the pool size', multiprocess_mode='livesum'
+)
+POOL_TIMEOUTS = prometheus_client.Counter(
+    'db_pool_timeouts', 'Checkouts that gave up waiting for a free connection'
+)
+API_LATENCY = prometheus_client.Histogram(
+    'api_request_duration_seconds', 'Time of each HTTP attempt to the remote API',
+    ('method', 'endpoint')
+)
+API_CALLS = prometheus_client.Counter(
+    'api_requests', 'Remote API attempts by outcome: status class, transport_error, '
+    'circuit_open or deadline_exceeded', ('method', 'endpoint', 'outcome')
+)
+PASSWORD_HASHING = prometheus_client.Histogram(
+    'password_hashing_seconds', 'Time to hash or verify a password', ('operation',),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+def observe_request(blueprint, endpoint, method, status, started):
+    REQUEST_LATENCY.labels(blueprint or 'app', endpoint or 'unmatched', method, status).observe(
+        time.perf_counter() - started
+    )
+
+def observe_api_call(method, endpoint, started, outcome):
+    """Latency and outcome of one HTTP attempt, outcome being e.g. '2xx' or 'transport_error'"""
+    endpoint = endpoint_key(endpoint)
+    API_LATENCY.labels(method, endpoint).observe(time.perf_counter() - started)
+    API_CALLS.labels(method, endpoint, outcome).inc()
+
+def count_api_refusal(method, endpoint, error):
+    """Count an attempt the breaker or the page deadline did not let through"""
+    outcome = 'circuit_open' if isinstance(error, CircuitOpen) else 'deadline_exceeded'
+    API_CALLS.labels(method, endpoint_key(endpoint), outcome).inc()
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool counting checkouts that time out waiting for a connection"""
+
+    def connect(self):
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            POOL_TIMEOUTS.inc()
+            raise
+
+def instrument_pool(engine):
+    """Track the engine's connections in use, surviving pool recreation"""
+    def update(returning):
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            POOL_CHECKED_OUT.set(pool.checkedout() - returning)
+            POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+    # Checkin fires before the connection is back in the pool, so it still counts as in use
+    event.listen(engine.pool, 'checkout', lambda *args: update(0))
+    event.listen(engine.pool, 'checkin', lambda *args: update(1))
+
+def exposition():
+    """Metrics text in the Prometheus format and its content type"""
+    if MULTIPROCESS:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,217 @@
+"""
+Versioned schema migrations for BaytAlSudani Admin Dashboard
+db.create_all() builds fresh databases; these migrations bring existing
+databases up to the same schema, building indexes concurrently so that
+production tables are never locked against writes
+"""
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Tuple
+from sqlalchemy import inspect, insert, select, text
+from models import db, SchemaMigration
+from search import SEARCH_FIELDS, normalize_sql, vector_sql
+
+# Arbitrary key for the PostgreSQL advisory lock serializing migration runs
+MIGRATION_LOCK_KEY = 72531
+MIGRATION_LOCK_POLL_SECONDS = 0.5
+
+@dataclass
+class Migration:
+    """One schema change, applied at most once per database"""
+    version: int
+    description: str
+    upgrade: Callable
+    # Non-transactional migrations run in autocommit mode, which
+    # CREATE INDEX CONCURRENTLY requires
+    transactional: bool = True
+
+def _create_index(connection, name, table, columns):
+    """Create an index without blocking writes, replacing an invalid leftover"""
+    if connection.dialect.name != 'postgresql':
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+        return
+
+    # A failed concurrent build leaves an INVALID index behind that
+    # IF NOT EXISTS would otherwise silently accept
+    invalid = connection.execute(text(
+        'SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+        'WHERE c.relname = :name AND NOT i.indisvalid'
+    ), {'name': name}).scalar()
+    if invalid:
+        connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+    connection.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})'))
+
+def _add_store_counts(connection):
+    existing = {column['name'] for column in inspect(connection).get_columns('stores')}
+    for column, child in (('products_count', 'products'), ('services_count', 'services')):
+        if column in existing:
+            continue
+        connection.execute(text(f'ALTER TABLE stores ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0'))
+        connection.execute(text(
+            f'UPDATE stores SET {column} = '
+            f'(SELECT COUNT(*) FROM {child} WHERE {child}.store_id = stores.id)'
+        ))
+
+HOT_PATH_INDEXES: Tuple[Tuple[str, str, str], ...] = (
+    ('ix_users_role_created_at', 'users', 'role, created_at, id'),
+    ('ix_stores_merchant_id', 'stores', 'merchant_id'),
+    ('ix_stores_created_at', 'stores', 'created_at, id'),
+    ('ix_products_store_id', 'products', 'store_id'),
+    ('ix_products_merchant_created_at', 'products', 'merchant_id, created_at, id'),
+    ('ix_products_created_at', 'products', 'created_at, id'),
+    ('ix_services_store_id', 'services', 'store_id'),
+    ('ix_services_created_at', 'services', 'created_at, id'),
+    ('ix_orders_merchant_status_created_at', 'orders', 'merchant_id, status, created_at'),
+    ('ix_orders_status_created_at', 'orders', 'status, created_at'),
+    ('ix_orders_product_id', 'orders', 'product_id'),
+    ('ix_orders_created_at', 'orders', 'created_at, id'),
+    ('ix_ads_created_at', 'ads', 'created_at, id'),
+    ('ix_jobs_created_at', 'jobs', 'created_at, id'),
+)
+
+def _hot_path_indexes(connection):
+    for name, table, columns in HOT_PATH_INDEXES:
+        _create_index(connection, name, table, columns)
+
+SEARCH_BACKFILL_BATCH = 5000
+
+def _search_vectors(connection):
+    """Trigger-maintained tsvector columns with GIN indexes on searchable tables"""
+    if connection.dialect.name != 'postgresql':
+        return
+
+    connection.execute(text(
+        f'CREATE OR REPLACE FUNCTION ar_normalize(value text) RETURNS text '
+        f'LANGUAGE sql IMMUTABLE AS $${normalize_sql()}$$'
+    ))
+    for table, fields in SEARCH_FIELDS.items():
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector'))
+        connection.execute(text(
+            f'CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger '
+            f'LANGUAGE plpgsql AS $$ BEGIN NEW.search_vector := {vector_sql("NEW", fields)}; '
+            f'RETURN NEW; END $$'
+        ))
+        connection.execute(text(f'DROP TRIGGER IF EXISTS {table}_search_vector ON {table}'))
+        connection.execute(text(
+            f'CREATE TRIGGER {table}_search_vector BEFORE INSERT OR UPDATE OF {", ".join(fields)} '
+            f'ON {table} FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update()'
+        ))
+
+        # Backfill in short autocommitted batches to avoid one long table lock
+        while connection.execute(text(
+            f'UPDATE {table} SET search_vector = {vector_sql(table, fields)} '
+            f'WHERE id IN (SELECT id FROM {table} WHERE search_vector IS NULL LIMIT {SEARCH_BACKFILL_BATCH})'
+        )).rowcount:
+            pass
+
+        connection.execute(text(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{table}_search_vector '
+            f'ON {table} USING gin (search_vector)'
+        ))
+
+CASCADE_FOREIGN_KEYS = (
+    ('stores', 'merchant_id', 'users'),
+    ('products', 'merchant_id', 'users'),
+    ('products', 'store_id', 'stores'),
+    ('services', 'store_id', 'stores'),
+    ('orders', 'merchant_id', 'users'),
+    ('orders', 'product_id', 'products'),
+)
+
+def _cascade_foreign_keys(connection):
+    """Recreate child foreign keys with ON DELETE CASCADE"""
+    if connection.dialect.name != 'postgresql':
+        return
+
+    for table, column, referred in CASCADE_FOREIGN_KEYS:
+        foreign_keys = inspect(connection).get_foreign_keys(table)
+        existing = next((fk for fk in foreign_keys if fk['constrained_columns'] == [column]), None)
+        if existing and existing.get('options', {}).get('ondelete', '').upper() == 'CASCADE':
+            continue
+        name = existing['name'] if existing else f'{table}_{column}_fkey'
+
+        # NOT VALID skips the full-table check under the ALTER's lock;
+        # VALIDATE then scans without blocking writes
+        drop = f'DROP CONSTRAINT {name}, ' if existing else ''
+        connection.execute(text(
+            f'ALTER TABLE {table} {drop}ADD CONSTRAINT {name} FOREIGN KEY ({column}) '
+            f'REFERENCES {referred} (id) ON DELETE CASCADE NOT VALID'
+        ))
+        connection.execute(text(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}'))
+
+def _rollup_watermark_index(connection):
+    _create_index(connection, 'ix_orders_updated_at', 'orders', 'updated_at')
+
+VERSION_INDEXES = (
+    ('ix_users_updated_at', 'users', 'updated_at'),
+    ('ix_stores_updated_at', 'stores', 'updated_at'),
+    ('ix_products_updated_at', 'products', 'updated_at'),
+    ('ix_services_updated_at', 'services', 'updated_at'),
+    ('ix_ads_updated_at', 'ads', 'updated_at'),
+    ('ix_jobs_updated_at', 'jobs', 'updated_at'),
+)
+
+def _version_indexes(connection):
+    """Indexes behind the max(updated_at) page versions of conditional GETs"""
+    for name, table, columns in VERSION_INDEXES:
+        _create_index(connection, name, table, columns)
+
+MIGRATIONS = [
+    Migration(1, 'Add per-store product and service counts', _add_store_counts),
+    Migration(2, 'Index hot query paths', _hot_path_indexes, transactional=False),
+    Migration(3, 'Arabic-aware full-text search vectors', _search_vectors, transactional=False),
+    Migration(4, 'Cascade deletes in the database', _cascade_foreign_keys, transactional=False),
+    Migration(5, 'Index order updates for rollup refreshes', _rollup_watermark_index, transactional=False),
+    Migration(6, 'Index row updates for conditional GETs', _version_indexes, transactional=False),
+]
+
+def _apply(migration):
+    with db.engine.connect() as connection:
+        if not migration.transactional:
+            connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+        migration.upgrade(connection)
+        connection.execute(insert(SchemaMigration.__table__).values(
+            version=migration.version,
+            description=migration.description,
+            applied_at=datetime.utcnow()
+        ))
+        connection.commit()
+
+def pending_migrations():
+    """Migrations not yet recorded in schema_migrations"""
+    applied = set(db.session.execute(select(SchemaMigration.version)).scalars())
+    db.session.commit()
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+@contextmanager
+def migration_lock(timeout=600):
+    """Hold the PostgreSQL advisory lock serializing schema changes across workers"""
+    with db.engine.connect() as connection:
+        if connection.dialect.name != 'postgresql':
+            yield
+            return
+        # Waiters poll outside any transaction: a blocked pg_advisory_lock call would
+        # hold a snapshot that the holder's CREATE INDEX CONCURRENTLY waits on forever
+        connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+        deadline = time.monotonic() + timeout
+        while not connection.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY}).scalar():
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"Timed out after {timeout}s waiting for the migration lock")
+            time.sleep(MIGRATION_LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+
+def run_migrations(lock_timeout=600):
+    """Apply pending migrations in version order, one worker at a time"""
+    with migration_lock(lock_timeout):
+        applied = []
+        for migration in pending_migrations():
+            logging.info(f"Applying migration {migration.version}: {migration.description}")
+            _apply(migration)
+            applied.append(migration.version)
+        return applied
@@ -5,7 +5,7 @@ import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import password_policy
 from datetime import datetime
 from sqlalchemy.orm import DeclarativeBase
 
@@ -17,6 +17,10 @@ db = SQLAlchemy(model_class=Base)
 class User(UserMixin, db.Model):
     """User model for both admins and merchants"""
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_role_created_at', 'role', 'created_at', 'id'),
+        db.Index('ix_users_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -27,18 +31,22 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Relationships
-    stores = db.relationship('Store', backref='merchant', lazy=True, cascade='all, delete-orphan')
-    products = db.relationship('Product', backref='merchant', lazy=True, cascade='all, delete-orphan')
-    orders = db.relationship('Order', backref='merchant', lazy=True, cascade='all, delete-orphan')
+    # Relationships (children are removed by ON DELETE CASCADE, see cascades.py)
+    stores = db.relationship('Store', backref='merchant', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    products = db.relationship('Product', backref='merchant', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    orders = db.relationship('Order', backref='merchant', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
         """Set password hash"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_policy.hash(password)
     
     def check_password(self, password):
         """Check password"""
-        return check_password_hash(self.password_hash, password)
+        return password_policy.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Check if the password hash predates the current hashing policy"""
+        return password_policy.needs_rehash(self.password_hash)
     
     def is_admin(self):
         """Check if user is admin"""
@@ -63,18 +71,26 @@ class User(UserMixin, db.Model):
 class Store(db.Model):
     """Store model"""
     __tablename__ = 'stores'
+    __table_args__ = (
+        db.Index('ix_stores_merchant_id', 'merchant_id'),
+        db.Index('ix_stores_created_at', 'created_at', 'id'),
+        db.Index('ix_stores_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    merchant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    merchant_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     is_active = db.Column(db.Boolean, default=True)
+    # Maintained by the listeners in counters.py
+    products_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    services_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    products = db.relationship('Product', backref='store', lazy=True, cascade='all, delete-orphan')
-    services = db.relationship('Service', backref='store', lazy=True, cascade='all, delete-orphan')
+    products = db.relationship('Product', backref='store', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    services = db.relationship('Service', backref='store', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -85,21 +101,27 @@ class Store(db.Model):
             'merchant_id': self.merchant_id,
             'merchant_name': self.merchant.username if self.merchant else None,
             'is_active': self.is_active,
-            'products_count': len(self.products),
-            'services_count': len(self.services),
+            'products_count': self.products_count or 0,
+            'services_count': self.services_count or 0,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 class Product(db.Model):
     """Product model"""
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_store_id', 'store_id'),
+        db.Index('ix_products_merchant_created_at', 'merchant_id', 'created_at', 'id'),
+        db.Index('ix_products_created_at', 'created_at', 'id'),
+        db.Index('ix_products_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     price = db.Column(db.Numeric(10, 2), nullable=False)
-    merchant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
+    merchant_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id', ondelete='CASCADE'), nullable=False)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -122,12 +144,17 @@ class Product(db.Model):
 class Service(db.Model):
     """Service model"""
     __tablename__ = 'services'
+    __table_args__ = (
+        db.Index('ix_services_store_id', 'store_id'),
+        db.Index('ix_services_created_at', 'created_at', 'id'),
+        db.Index('ix_services_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     price = db.Column(db.Numeric(10, 2), nullable=False)
-    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id', ondelete='CASCADE'), nullable=False)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -150,14 +177,21 @@ class Service(db.Model):
 class Order(db.Model):
     """Order model"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('ix_orders_merchant_status_created_at', 'merchant_id', 'status', 'created_at'),
+        db.Index('ix_orders_status_created_at', 'status', 'created_at'),
+        db.Index('ix_orders_product_id', 'product_id'),
+        db.Index('ix_orders_created_at', 'created_at', 'id'),
+        db.Index('ix_orders_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     total_price = db.Column(db.Numeric(10, 2), nullable=False)
     status = db.Column(db.Enum('pending', 'confirmed', 'shipping', 'delivered', 'cancelled', name='order_status'), 
                       default='pending')
-    merchant_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    merchant_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     customer_name = db.Column(db.String(100), nullable=False)
     customer_phone = db.Column(db.String(20), nullable=False)
     customer_address = db.Column(db.Text, nullable=False)
@@ -165,7 +199,7 @@ class Order(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    product = db.relationship('Product', backref='orders', lazy=True)
+    product = db.relationship('Product', backref=db.backref('orders', passive_deletes=True), lazy=True)
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -187,6 +221,10 @@ class Order(db.Model):
 class Advertisement(db.Model):
     """Advertisement model"""
     __tablename__ = 'ads'
+    __table_args__ = (
+        db.Index('ix_ads_created_at', 'created_at', 'id'),
+        db.Index('ix_ads_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -210,6 +248,10 @@ class Advertisement(db.Model):
 class Job(db.Model):
     """Job posting model"""
     __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_created_at', 'created_at', 'id'),
+        db.Index('ix_jobs_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -232,4 +274,84 @@ class Job(db.Model):
             'salary': self.salary,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+class StatsCounter(db.Model):
+    """Incrementally maintained dashboard counter, global or per merchant"""
+    __tablename__ = 'stats_counters'
+    
+    # merchant_id 0 holds the platform-wide counters
+    merchant_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SchemaMigration(db.Model):
+    """Applied schema migration, see migrations.py"""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class BackgroundTask(db.Model):
+    """Queued unit of background work, see tasks.py"""
+    __tablename__ = 'background_tasks'
+    __table_args__ = (
+        db.Index('ix_background_tasks_status_run_after', 'status', 'run_after'),
+        db.Index('ix_background_tasks_created_at', 'created_at', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'result': self.result,
+            'error': self.error,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class DailyOrderRollup(db.Model):
+    """Orders, quantity and revenue per (day, merchant, status), see rollups.py"""
+    __tablename__ = 'daily_order_rollups'
+    __table_args__ = (
+        db.Index('ix_daily_order_rollups_merchant_day', 'merchant_id', 'day'),
+    )
+    
+    day = db.Column(db.Date, primary_key=True)
+    merchant_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    status = db.Column(db.String(20), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class RollupWatermark(db.Model):
+    """Highest source updated_at already folded into a rollup"""
+    __tablename__ = 'rollup_watermarks'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.DateTime)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,248 @@
+"""
+Pagination helpers for BaytAlSudani Admin Dashboard
+Offset pagination for numbered pages, keyset pagination over
+(created_at, id) with opaque cursor tokens for deep listings, and
+exact, cached or planner-estimated listing totals
+"""
+import base64
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, List, Optional
+from flask import current_app, request
+from sqlalchemy import and_, or_, text, tuple_
+from models import db
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+_COUNT_CACHE_MAX = 1024
+
+@dataclass
+class CountResult:
+    """Total row count of a listing and whether it is a planner estimate"""
+    value: int
+    estimated: bool = False
+
+def _exact_count(query):
+    return CountResult(query.order_by(None).count())
+
+def _cached_count(query, ttl):
+    """Exact count reused for ttl seconds by every request in this worker"""
+    statement = query.order_by(None).statement.compile(dialect=db.engine.dialect)
+    key = (str(statement), repr(sorted(statement.params.items())))
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(key)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    result = _exact_count(query)
+    with _count_cache_lock:
+        if len(_count_cache) >= _COUNT_CACHE_MAX:
+            _count_cache.clear()
+        _count_cache[key] = (result, now + ttl)
+    return result
+
+def _planner_rows(query, model):
+    """Row estimate from pg_class for a whole table, otherwise from EXPLAIN"""
+    statement = query.order_by(None).statement
+    if statement.whereclause is None:
+        return db.session.execute(
+            text('SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)'),
+            {'table': model.__tablename__}
+        ).scalar()
+
+    compiled = statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(
+        'EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+def _estimated_count(query, model, threshold):
+    """Planner estimate for big listings, exact count for small ones"""
+    if db.engine.dialect.name != 'postgresql':
+        return _exact_count(query)
+    rows = _planner_rows(query, model)
+    # reltuples is -1 for tables that were never analyzed
+    if rows is None or rows < threshold:
+        return _exact_count(query)
+    return CountResult(int(rows), estimated=True)
+
+def count_total(query, model):
+    """Total for a listing using the configured count mode"""
+    mode = current_app.config.get('PAGINATION_COUNT_MODE', 'exact')
+    if mode == 'cached':
+        return _cached_count(query, current_app.config.get('PAGINATION_COUNT_TTL', 60))
+    if mode == 'estimate':
+        return _estimated_count(query, model, current_app.config.get('PAGINATION_ESTIMATE_THRESHOLD', 100000))
+    return _exact_count(query)
+
+def format_approx_count(value):
+    """Compact approximate count such as ~1.2M"""
+    for divisor, suffix in ((1_000_000_000, 'B'), (1_000_000, 'M'), (1_000, 'K')):
+        if value >= divisor:
+            return f"~{value / divisor:.1f}".rstrip('0').rstrip('.') + suffix
+    return f"~{value}"
+
+@dataclass
+class KeysetPage:
+    """One page of a keyset paginated listing"""
+    items: List[Any] = field(default_factory=list)
+    per_page: int = 20
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+    total: Optional[int] = None
+    total_estimated: bool = False
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+@dataclass
+class ListPage:
+    """Page of a list view in either pagination mode, ready for templates"""
+    items: List[Any]
+    total: Optional[int]
+    total_estimated: bool = False
+    current_page: int = 1
+    total_pages: int = 0
+    has_prev: bool = False
+    has_next: bool = False
+    prev_num: Optional[int] = None
+    next_num: Optional[int] = None
+    keyset: Optional[KeysetPage] = None
+
+    def template_args(self):
+        """Navigation arguments shared by every list template"""
+        return {
+            'current_page': self.current_page,
+            'total_pages': self.total_pages,
+            'has_prev': self.has_prev,
+            'has_next': self.has_next,
+            'prev_num': self.prev_num,
+            'next_num': self.next_num,
+            'keyset': self.keyset,
+            'total_estimated': self.total_estimated,
+        }
+
+def encode_cursor(row, direction):
+    """Opaque token pointing just past a row in the given direction"""
+    payload = {
+        'c': row.created_at.isoformat() if row.created_at else None,
+        'i': row.id,
+        'd': direction,
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Decode a cursor token, returning None for anything malformed"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        return (
+            None if payload['c'] is None else datetime.fromisoformat(payload['c']),
+            int(payload['i']),
+            'prev' if payload['d'] == 'prev' else 'next',
+        )
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def _past_cursor(model, created_at, row_id, direction):
+    """Rows after a cursor, rows without created_at sorting as the newest"""
+    key = tuple_(model.created_at, model.id)
+    if direction == 'next':
+        if created_at is None:
+            return or_(and_(model.created_at.is_(None), model.id < row_id), model.created_at.isnot(None))
+        return key < tuple_(created_at, row_id)
+    if created_at is None:
+        return and_(model.created_at.is_(None), model.id > row_id)
+    return or_(key > tuple_(created_at, row_id), model.created_at.is_(None))
+
+def keyset_paginate(query, model, cursor=None, per_page=20, with_total=True):
+    """Paginate newest first over (created_at, id) without OFFSET"""
+    count = count_total(query, model) if with_total else None
+
+    decoded = decode_cursor(cursor)
+    if decoded is None:
+        created_at, row_id, direction = None, None, 'next'
+        page_query = query
+    else:
+        created_at, row_id, direction = decoded
+        page_query = query.filter(_past_cursor(model, created_at, row_id, direction))
+
+    # NULLs first when descending is PostgreSQL's own order, so the (created_at, id) index still serves it
+    if direction == 'next':
+        page_query = page_query.order_by(model.created_at.desc().nullsfirst(), model.id.desc())
+    else:
+        page_query = page_query.order_by(model.created_at.asc().nullslast(), model.id.asc())
+
+    # One extra row tells whether another page exists in the travel direction
+    rows = page_query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+
+    page = KeysetPage(
+        items=rows,
+        per_page=per_page,
+        total=count.value if count else None,
+        total_estimated=count.estimated if count else False
+    )
+    if rows:
+        more_after = has_more if direction == 'next' else True
+        more_before = decoded is not None if direction == 'next' else has_more
+        if more_after:
+            page.next_cursor = encode_cursor(rows[-1], 'next')
+        if more_before:
+            page.prev_cursor = encode_cursor(rows[0], 'prev')
+    return page
+
+def paginate_list(query, model, per_page=20):
+    """Paginate a list view in the mode requested by the URL or configured"""
+    mode = request.args.get('paging') or current_app.config.get('PAGINATION_MODE', 'offset')
+    if mode == 'keyset' or 'cursor' in request.args:
+        page = keyset_paginate(
+            query, model,
+            cursor=request.args.get('cursor'),
+            per_page=per_page,
+            with_total=current_app.config.get('PAGINATION_TOTALS', True)
+        )
+        return ListPage(
+            items=page.items,
+            total=page.total,
+            total_estimated=page.total_estimated,
+            has_prev=page.has_prev,
+            has_next=page.has_next,
+            keyset=page
+        )
+
+    current_page = request.args.get('page', 1, type=int)
+    pagination = query.order_by(model.created_at.desc(), model.id.desc()).paginate(
+        page=current_page, per_page=per_page, error_out=False, count=False
+    )
+    # The count provider replaces paginate()'s own COUNT(*)
+    count = count_total(query, model)
+    pagination.total = count.value
+    return ListPage(
+        items=pagination.items,
+        total=count.value,
+        total_estimated=count.estimated,
+        current_page=current_page,
+        total_pages=pagination.pages,
+        has_prev=pagination.has_prev,
+        has_next=pagination.has_next,
+        prev_num=pagination.prev_num,
+        next_num=pagination.next_num
+    )
@@ -0,0 +1,48 @@
+"""
+Password hashing policy for BaytAlSudani Admin Dashboard
+One configurable Werkzeug method and cost is used for new hashes, and
+stored hashes made under another policy are replaced on the next
+successful login, when the plain password is at hand
+"""
+from werkzeug.security import generate_password_hash, check_password_hash
+from metrics import PASSWORD_HASHING
+
+class HashingPolicy:
+    """Hashing method and cost, in Werkzeug's 'scrypt:n:r:p' / 'pbkdf2:hash:iterations' form"""
+
+    def __init__(self, method='scrypt', salt_length=16):
+        self.method = method
+        self.salt_length = salt_length
+        self._resolved = None
+
+    def configure(self, method, salt_length=16):
+        self.method = method
+        self.salt_length = salt_length
+        self._resolved = None
+
+    @property
+    def resolved_method(self):
+        """Method with Werkzeug's defaults filled in, as written into hashes"""
+        if self._resolved is None:
+            # Shorthand methods like 'scrypt' only show their parameters in a hash
+            self._resolved = self.hash('').split('$', 1)[0]
+        return self._resolved
+
+    def hash(self, password):
+        with PASSWORD_HASHING.labels('hash').time():
+            return generate_password_hash(password, method=self.method, salt_length=self.salt_length)
+
+    def verify(self, stored, password):
+        if not stored:
+            return False
+        with PASSWORD_HASHING.labels('verify').time():
+            return check_password_hash(stored, password)
+
+    def needs_rehash(self, stored):
+        """Whether a stored hash was made under a different method or cost"""
+        if not stored or '$' not in stored:
+            return True
+        method, salt, _ = stored.split('$', 2)
+        return method != self.resolved_method or len(salt) != self.salt_length
+
+password_policy = HashingPolicy()
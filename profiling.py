@@ -0,0 +1,160 @@
+"""
+Request profiling for BaytAlSudani Admin Dashboard
+Every SQL statement a request runs is timed through the engine's cursor
+events, and the response time is split into database, template and Python
+time; the summary goes out in a Server-Timing header and one log line,
+with statement shapes that repeat within a request flagged as N+1 suspects
+"""
+import heapq
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Longest statement text kept in a summary
+STATEMENT_PREVIEW = 300
+
+current_profile: ContextVar[Optional['RequestProfile']] = ContextVar('request_profile', default=None)
+
+_registered = False
+
+def statement_shape(statement: str) -> str:
+    """Statement with literals and expanded IN lists folded, so repeats of one query compare equal"""
+    shape = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    shape = re.sub(r'\b\d+(?:\.\d+)?\b', '?', shape)
+    shape = re.sub(r'%\(\w+\)s|%s|:\w+|\$\d+', '?', shape)
+    shape = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?)', shape)
+    return re.sub(r'\s+', ' ', shape).strip()
+
+class RequestProfile:
+    """SQL and template timings of one request"""
+
+    def __init__(self, slowest=5, repeat_threshold=5):
+        self.started = time.perf_counter()
+        self.slowest_count = slowest
+        self.repeat_threshold = repeat_threshold
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.template_started = 0.0
+        self.template_db_time = 0.0
+        self.slowest = []
+        self.shapes = Counter()
+
+    def record_query(self, statement, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.shapes[statement_shape(statement)] += 1
+        entry = (duration, self.queries, statement[:STATEMENT_PREVIEW])
+        if len(self.slowest) < self.slowest_count:
+            heapq.heappush(self.slowest, entry)
+        elif self.slowest and duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def template_start(self):
+        # Templates rendered from within a template count once, as part of the outer one
+        if self.template_depth == 0:
+            self.template_started = time.perf_counter()
+            self.template_db_time = self.db_time
+        self.template_depth += 1
+
+    def template_end(self):
+        if self.template_depth == 0:
+            return
+        self.template_depth -= 1
+        if self.template_depth == 0:
+            # Lazy loads issued while rendering are database time, not template time
+            elapsed = time.perf_counter() - self.template_started
+            self.template_time += elapsed - (self.db_time - self.template_db_time)
+
+    def repeated(self):
+        """Statement shapes run at least the repeat threshold times, most frequent first"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= self.repeat_threshold]
+
+    def summary(self):
+        total = time.perf_counter() - self.started
+        return {
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(self.db_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'python_ms': round(max(total - self.db_time - self.template_time, 0) * 1000, 2),
+            'queries': self.queries,
+            'slowest': [
+                {'ms': round(duration * 1000, 2), 'statement': statement}
+                for duration, _, statement in sorted(self.slowest, reverse=True)
+            ],
+            'n_plus_one': [{'count': count, 'shape': shape[:STATEMENT_PREVIEW]} for shape, count in self.repeated()],
+        }
+
+def server_timing(summary):
+    """Server-Timing header value of a profile summary"""
+    return ', '.join([
+        f'db;dur={summary["db_ms"]};desc="{summary["queries"]} queries"',
+        f'tpl;dur={summary["template_ms"]}',
+        f'app;dur={summary["python_ms"]}',
+        f'total;dur={summary["total_ms"]}',
+    ])
+
+def start_profile(slowest=5, repeat_threshold=5):
+    current_profile.set(RequestProfile(slowest, repeat_threshold))
+
+def finish_profile():
+    """Summary of the current request's profile, or None when it is not profiled"""
+    profile = current_profile.get()
+    return profile.summary() if profile is not None else None
+
+def clear_profile():
+    current_profile.set(None)
+
+def log_profile(method, path, status, summary):
+    """One structured log line per profiled request, a warning when N+1 suspects showed up"""
+    line = json.dumps(dict(summary, method=method, path=path, status=status), ensure_ascii=False)
+    if summary['n_plus_one']:
+        logging.warning(f"Request profile: {line}")
+    else:
+        logging.info(f"Request profile: {line}")
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile.get() is not None:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile.get()
+    started = conn.info.get('profile_started')
+    if profile is not None and started:
+        profile.record_query(statement, time.perf_counter() - started.pop())
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('profile_started'):
+        connection.info['profile_started'].pop()
+
+def _template_starting(sender, template, context, **extra):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.template_start()
+
+def _template_rendered(sender, template, context, **extra):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.template_end()
+
+def register_listeners():
+    """Time every cursor execution and template render of profiled requests"""
+    global _registered
+    if _registered:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    before_render_template.connect(_template_starting, weak=False)
+    template_rendered.connect(_template_rendered, weak=False)
+    _registered = True
@@ -0,0 +1,132 @@
+"""
+Daily order rollups for BaytAlSudani Admin Dashboard
+daily_order_rollups holds orders, quantity and revenue per (day, merchant,
+status); whole days are re-aggregated when their orders change, found
+through an orders.updated_at watermark, so charts never scan raw orders
+"""
+from datetime import datetime, time, timedelta
+from flask import current_app
+from sqlalchemy import Date, DateTime, delete, func, insert, literal, select, text
+from models import db, Order, DailyOrderRollup, RollupWatermark
+
+ROLLUP_NAME = 'daily_orders'
+# Arbitrary key for the PostgreSQL advisory lock serializing refreshes
+ROLLUP_LOCK_KEY = 72532
+# Re-read a little before the watermark so rows from transactions that
+# committed late with an earlier updated_at are not missed
+ROLLUP_OVERLAP = timedelta(minutes=5)
+CHART_RANGES = (7, 30, 365)
+
+_ROLLUP_COLUMNS = ['day', 'merchant_id', 'status', 'orders', 'quantity', 'revenue', 'updated_at']
+
+def _aggregate(day_column, now):
+    return select(
+        day_column,
+        Order.merchant_id,
+        Order.status,
+        func.count(),
+        func.coalesce(func.sum(Order.quantity), 0),
+        func.coalesce(func.sum(Order.total_price), 0),
+        literal(now, DateTime)
+    )
+
+def refresh_days(days):
+    """Re-aggregate whole days of orders into the rollup table"""
+    now = datetime.utcnow()
+    for day in sorted(set(days)):
+        start = datetime.combine(day, time.min)
+        db.session.execute(delete(DailyOrderRollup).where(DailyOrderRollup.day == day))
+        db.session.execute(insert(DailyOrderRollup).from_select(
+            _ROLLUP_COLUMNS,
+            _aggregate(literal(day, Date), now)
+            .where(Order.created_at >= start, Order.created_at < start + timedelta(days=1))
+            .group_by(Order.merchant_id, Order.status)
+        ))
+
+def rebuild_rollups():
+    """Recompute every rollup row from the orders table"""
+    order_day = func.date(Order.created_at, type_=Date)
+    db.session.execute(delete(DailyOrderRollup))
+    db.session.execute(insert(DailyOrderRollup).from_select(
+        _ROLLUP_COLUMNS,
+        _aggregate(order_day, datetime.utcnow())
+        .where(Order.created_at.isnot(None))
+        .group_by(order_day, Order.merchant_id, Order.status)
+    ))
+
+def changed_days(since):
+    """Days holding orders created or updated after a point in time"""
+    return db.session.execute(
+        select(func.date(Order.created_at, type_=Date))
+        .where(Order.updated_at > since, Order.created_at.isnot(None))
+        .distinct()
+    ).scalars().all()
+
+def _try_lock():
+    """Transaction-scoped lock so only one worker refreshes at a time"""
+    if db.engine.dialect.name != 'postgresql':
+        return True
+    return db.session.execute(
+        text('SELECT pg_try_advisory_xact_lock(:key)'), {'key': ROLLUP_LOCK_KEY}
+    ).scalar()
+
+def refresh_rollups(full=False):
+    """Fold orders changed since the watermark into the rollups and commit"""
+    if not _try_lock():
+        db.session.rollback()
+        return None
+
+    watermark = db.session.get(RollupWatermark, ROLLUP_NAME)
+    high = db.session.scalar(select(func.max(Order.updated_at)))
+    if full or watermark is None or watermark.value is None:
+        rebuild_rollups()
+        days = None
+    else:
+        days = changed_days(watermark.value - ROLLUP_OVERLAP)
+        refresh_days(days)
+
+    if watermark is None:
+        watermark = RollupWatermark(name=ROLLUP_NAME)
+        db.session.add(watermark)
+    watermark.value = high or watermark.value
+    watermark.refreshed_at = datetime.utcnow()
+    db.session.commit()
+    return days
+
+def is_stale():
+    """Whether the last refresh is older than the configured interval"""
+    interval = current_app.config.get('ROLLUP_REFRESH_INTERVAL', 60)
+    refreshed_at = db.session.scalar(
+        select(RollupWatermark.refreshed_at).where(RollupWatermark.name == ROLLUP_NAME)
+    )
+    return refreshed_at is None or datetime.utcnow() - refreshed_at > timedelta(seconds=interval)
+
+def order_timeseries(days=30, merchant_id=None):
+    """Daily orders, delivered revenue and cancellations for the last days, oldest first"""
+    today = datetime.utcnow().date()
+    first_day = today - timedelta(days=days - 1)
+    query = (
+        select(
+            DailyOrderRollup.day,
+            func.sum(DailyOrderRollup.orders),
+            func.sum(DailyOrderRollup.revenue).filter(DailyOrderRollup.status == 'delivered'),
+            func.sum(DailyOrderRollup.orders).filter(DailyOrderRollup.status == 'cancelled')
+        )
+        .where(DailyOrderRollup.day >= first_day)
+        .group_by(DailyOrderRollup.day)
+    )
+    if merchant_id is not None:
+        query = query.where(DailyOrderRollup.merchant_id == merchant_id)
+
+    by_day = {row[0]: row[1:] for row in db.session.execute(query)}
+    series = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        orders, revenue, cancelled = by_day.get(day, (0, 0, 0))
+        series.append({
+            'day': day.isoformat(),
+            'orders': int(orders or 0),
+            'revenue': float(revenue or 0),
+            'cancelled': int(cancelled or 0),
+        })
+    return series
@@ -0,0 +1,91 @@
+"""
+Arabic-aware full-text search for BaytAlSudani Admin Dashboard
+Products, services and jobs carry a trigger-maintained tsvector column
+with a GIN index (see migrations.py); queries are normalized the same way
+"""
+import re
+from sqlalchemy import func, literal_column, or_
+from models import db, Store, Product, Service, Job
+from serializers import list_loaders
+
+SEARCH_CONFIG = 'simple'
+
+# Alef variants, alef maqsura and ta marbuta folded to a single form
+ARABIC_FOLDING = {
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي',
+    'ة': 'ه',
+}
+# Tashkeel, superscript alef and tatweel
+ARABIC_DIACRITICS_CLASS = '[\u064b-\u0652\u0670\u0640]'
+ARABIC_DIACRITICS = re.compile(ARABIC_DIACRITICS_CLASS)
+
+# Weighted source columns of each searchable table, most important first
+SEARCH_FIELDS = {
+    'products': ('name', 'description'),
+    'services': ('name', 'description'),
+    'jobs': ('title', 'company', 'description'),
+}
+
+SEARCHABLE = {
+    'products': Product,
+    'services': Service,
+    'jobs': Job,
+}
+
+_FOLDING_TABLE = str.maketrans(ARABIC_FOLDING)
+_TERM = re.compile(r'\w+')
+
+def normalize_arabic(value):
+    """Fold Arabic letter variants and strip diacritics, as ar_normalize() does in SQL"""
+    return ARABIC_DIACRITICS.sub('', (value or '').translate(_FOLDING_TABLE)).lower()
+
+def normalize_sql():
+    """Body of the ar_normalize() SQL function mirroring normalize_arabic()"""
+    source = ''.join(ARABIC_FOLDING)
+    target = ''.join(ARABIC_FOLDING.values())
+    return (
+        f"SELECT lower(regexp_replace(translate(coalesce(value, ''), '{source}', '{target}'), "
+        f"'{ARABIC_DIACRITICS_CLASS}', '', 'g'))"
+    )
+
+def vector_sql(row, fields):
+    """Weighted tsvector expression over the given columns of a row"""
+    parts = [
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', ar_normalize({row}.{field})), '{weight}')"
+        for field, weight in zip(fields, 'ABCD')
+    ]
+    return ' || '.join(parts)
+
+def build_tsquery(text):
+    """Prefix-matching tsquery text requiring every term in the query"""
+    terms = _TERM.findall(normalize_arabic(text))
+    return ' & '.join(f'{term}:*' for term in terms)
+
+def search_catalog(kind, text, limit=20, merchant_id=None):
+    """Best matching rows of one searchable kind, highest rank first"""
+    model = SEARCHABLE[kind]
+    query = model.query.options(*list_loaders(model))
+    if merchant_id is not None:
+        if model is Product:
+            query = query.filter(Product.merchant_id == merchant_id)
+        elif model is Service:
+            query = query.join(Store, Service.store_id == Store.id).filter(Store.merchant_id == merchant_id)
+
+    tsquery_text = build_tsquery(text)
+    if not tsquery_text:
+        return []
+
+    if db.engine.dialect.name != 'postgresql':
+        pattern = f'%{text.strip()}%'
+        columns = [getattr(model, field) for field in SEARCH_FIELDS[kind]]
+        return query.filter(or_(*[column.ilike(pattern) for column in columns])).limit(limit).all()
+
+    vector = literal_column(f'{model.__tablename__}.search_vector')
+    tsquery = func.to_tsquery(SEARCH_CONFIG, tsquery_text)
+    return (
+        query.filter(vector.op('@@')(tsquery))
+        .order_by(func.ts_rank_cd(vector, tsquery).desc(), model.id.desc())
+        .limit(limit)
+        .all()
+    )
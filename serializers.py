@@ -0,0 +1,56 @@
+"""
+Serialization helpers for BaytAlSudani Admin Dashboard
+List endpoints declare their relationship loading up front and serialize
+without falling back to per-row lazy loads
+"""
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+from models import Store, Product, Service, Order
+
+_serializing = ContextVar('serializing', default=False)
+
+class LazyLoadError(RuntimeError):
+    """Raised in strict mode when serialization triggers a lazy load"""
+
+def list_loaders(model):
+    """Relationship loading strategy for list pages of a model
+
+    List rows only read many-to-one relationships, which joinedload fetches in
+    the page query itself. A collection added to a list would take selectinload
+    instead, so its rows do not multiply the page's rows and break LIMIT.
+    """
+    loaders = {
+        Store: (joinedload(Store.merchant),),
+        Product: (joinedload(Product.merchant), joinedload(Product.store)),
+        Service: (joinedload(Service.store).joinedload(Store.merchant),),
+        Order: (joinedload(Order.product), joinedload(Order.merchant)),
+    }
+    return loaders.get(model, ())
+
+@contextmanager
+def no_lazy_loads():
+    """Mark a block in which relationship lazy loads are not expected"""
+    token = _serializing.set(True)
+    try:
+        yield
+    finally:
+        _serializing.reset(token)
+
+def serialize(items):
+    """Convert model instances to dictionaries without lazy loading"""
+    with no_lazy_loads():
+        return [item.to_dict() for item in items]
+
+@event.listens_for(Session, 'do_orm_execute')
+def _check_lazy_load(orm_execute_state):
+    if not _serializing.get() or not orm_execute_state.is_relationship_load:
+        return
+    mapper = orm_execute_state.bind_mapper
+    message = f"Lazy load of {mapper.class_.__name__ if mapper else 'relationship'} during serialization"
+    if has_app_context() and current_app.config.get('STRICT_SERIALIZATION'):
+        raise LazyLoadError(message)
+    logging.warning(message)
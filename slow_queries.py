@@ -0,0 +1,160 @@
+"""
+Slow query log for BaytAlSudani Admin Dashboard
+SELECTs running longer than the threshold are captured with their
+parameters and route into a per-worker ring buffer, and a background
+thread adds their plan from a separate read-only connection, so the
+page that ran the query never waits for its EXPLAIN
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import has_request_context, request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+from profiling import STATEMENT_PREVIEW, statement_shape
+
+# Captures waiting for their plan; more are kept without one
+EXPLAIN_QUEUE_SIZE = 32
+PARAMETERS_PREVIEW = 500
+
+_registered = False
+
+class SlowQueryLog:
+    """Ring buffer of slow statements and the thread that explains them"""
+
+    def __init__(self, threshold_ms=500, size=100, explain=True, explain_timeout_ms=5000, explain_interval=300):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.pending = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+        self.explainer = None
+        self.explain_engines = {}
+        self.configure(threshold_ms, size, explain, explain_timeout_ms, explain_interval)
+
+    def configure(self, threshold_ms, size, explain=True, explain_timeout_ms=5000, explain_interval=300):
+        with self.lock:
+            self.threshold = threshold_ms / 1000
+            self.captures = deque(maxlen=size)
+            self.explain = explain
+            self.explain_timeout_ms = explain_timeout_ms
+            self.explain_interval = explain_interval
+            self.explained = {}
+
+    def record(self, engine, statement, parameters, duration):
+        """Keep a slow statement and queue it for EXPLAIN unless its shape was explained recently"""
+        shape = statement_shape(statement)
+        capture = {
+            'id': next(self.ids),
+            'captured_at': datetime.utcnow(),
+            'duration_ms': round(duration * 1000, 2),
+            'route': f"{request.method} {request.path} ({request.endpoint})" if has_request_context() else 'background',
+            'statement': statement,
+            'parameters': repr(parameters)[:PARAMETERS_PREVIEW],
+            'plan': None,
+            'plan_status': 'disabled',
+        }
+        logging.warning(f"Slow query ({capture['duration_ms']} ms) on {capture['route']}: {statement[:STATEMENT_PREVIEW]}")
+        now = time.monotonic()
+        with self.lock:
+            self.captures.append(capture)
+            if not self.explain:
+                return capture
+            # One plan per statement shape and interval is enough to spot a missing index
+            if now - self.explained.get(shape, -self.explain_interval) < self.explain_interval:
+                capture['plan_status'] = 'recent'
+                return capture
+            self.explained = {key: at for key, at in self.explained.items() if now - at < self.explain_interval}
+            self.explained[shape] = now
+        try:
+            self.pending.put_nowait((engine, capture, parameters))
+            capture['plan_status'] = 'pending'
+        except queue.Full:
+            # A burst of slow pages must not pile up EXPLAINs
+            capture['plan_status'] = 'skipped'
+            return capture
+        self._ensure_explainer()
+        return capture
+
+    def recent(self):
+        """Captures, newest first"""
+        with self.lock:
+            return list(reversed(self.captures))
+
+    def _ensure_explainer(self):
+        with self.lock:
+            if self.explainer is None or not self.explainer.is_alive():
+                self.explainer = threading.Thread(target=self._explain_pending, name='slow-query-explain', daemon=True)
+                self.explainer.start()
+
+    def _explain_pending(self):
+        while True:
+            engine, capture, parameters = self.pending.get()
+            try:
+                capture['plan'] = self.explain_plan(engine, capture['statement'], parameters)
+                capture['plan_status'] = 'ready'
+            except Exception as e:
+                capture['plan_status'] = 'failed'
+                capture['plan'] = str(e)
+                logging.error(f"Slow query EXPLAIN error: {e}")
+
+    def _explain_engine(self, engine):
+        # Connections outside the application pool, so EXPLAINs never take one from a page
+        explain_engine = self.explain_engines.get(engine.url)
+        if explain_engine is None:
+            explain_engine = self.explain_engines[engine.url] = create_engine(engine.url, poolclass=NullPool)
+        return explain_engine
+
+    def explain_plan(self, engine, statement, parameters):
+        """Plan of a statement as text, run in a read-only transaction that is rolled back"""
+        with self._explain_engine(engine).connect() as connection:
+            connection.info['slow_query_explain'] = True
+            try:
+                if connection.dialect.name == 'postgresql':
+                    # ANALYZE runs the statement again, so it gets a time limit and no write access
+                    connection.exec_driver_sql('SET TRANSACTION READ ONLY')
+                    connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}')
+                    rows = connection.exec_driver_sql(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+                else:
+                    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+                return '\n'.join(' '.join(str(column) for column in row) for row in rows)
+            finally:
+                connection.rollback()
+
+slow_query_log = SlowQueryLog()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('slow_query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('slow_query_started')
+    if not started:
+        return
+    duration = time.perf_counter() - started.pop()
+    if duration < slow_query_log.threshold or executemany or conn.info.get('slow_query_explain'):
+        return
+    # Only reads are explained; data-modifying CTEs fail in the read-only transaction
+    if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return
+    try:
+        slow_query_log.record(conn.engine, statement, parameters, duration)
+    except Exception as e:
+        logging.error(f"Slow query log error: {e}")
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('slow_query_started'):
+        connection.info['slow_query_started'].pop()
+
+def register_listeners(threshold_ms):
+    """Time every statement, unless the threshold (ms) disables the log"""
+    global _registered
+    if _registered or threshold_ms <= 0:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    _registered = True
@@ -19,7 +19,8 @@ const App = {
         this.setupTooltips();
         this.setupConfirmDialogs();
         this.setupAjaxDefaults();
-        this.setupAutoRefresh();
+        this.setupFragments();
+        this.setupLiveFeed();
         this.setupKeyboardShortcuts();
         this.setupTheme();
         console.log('BaytAlSudani Dashboard initialized successfully');
@@ -154,19 +155,145 @@ App.setupAjaxDefaults = function() {
     });
 };
 
-// Auto-refresh functionality
-App.setupAutoRefresh = function() {
-    const autoRefreshElements = document.querySelectorAll('[data-auto-refresh]');
+// In-place refreshes of page fragments served with ?fragment=1
+App.fragmentUrl = function(url) {
+    const target = new URL(url, location.href);
+    target.searchParams.set('fragment', '1');
+    return target;
+};
+
+App.loadFragment = function(element, url) {
+    return fetch(App.fragmentUrl(url), {credentials: 'same-origin'})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.text();
+        })
+        .then(html => {
+            const template = document.createElement('template');
+            template.innerHTML = html.trim();
+            const replacement = template.content.querySelector(`[data-fragment="${element.dataset.fragment}"]`);
+            if (!replacement) {
+                throw new Error('Fragment missing from response');
+            }
+            element.replaceWith(replacement);
+            return replacement;
+        });
+};
+
+App.refreshFragments = function(name) {
+    const selector = name ? `[data-fragment="${name}"]` : '[data-fragment]';
+    document.querySelectorAll(selector).forEach(element => {
+        App.loadFragment(element, location.href).catch(error => {
+            console.error('Fragment refresh error:', error);
+        });
+    });
+};
+
+App.setupFragments = function() {
+    // Pagination inside a fragment swaps only that fragment
+    document.addEventListener('click', event => {
+        const link = event.target.closest('[data-fragment] a.page-link');
+        if (!link || event.ctrlKey || event.metaKey || event.shiftKey) {
+            return;
+        }
+        event.preventDefault();
+        const element = link.closest('[data-fragment]');
+        App.loadFragment(element, link.href)
+            .then(replacement => {
+                history.pushState({fragment: replacement.dataset.fragment}, '', link.href);
+                replacement.scrollIntoView({behavior: 'smooth', block: 'start'});
+            })
+            .catch(() => {
+                location.href = link.href;
+            });
+    });
     
-    autoRefreshElements.forEach(element => {
-        const interval = parseInt(element.dataset.autoRefresh) || 30000; // Default 30 seconds
-        
-        setInterval(() => {
-            if (document.visibilityState === 'visible') {
-                location.reload();
+    window.addEventListener('popstate', event => {
+        if (event.state && event.state.fragment) {
+            App.refreshFragments(event.state.fragment);
+        }
+    });
+    
+    if (document.querySelector('[data-fragment]')) {
+        history.replaceState({fragment: document.querySelector('[data-fragment]').dataset.fragment}, '', location.href);
+    }
+};
+
+// Live updates pushed by the server instead of full page reloads
+App.orderStatusLabels = {
+    pending: ['bg-warning', 'في الانتظار'],
+    confirmed: ['bg-info', 'مؤكد'],
+    shipping: ['bg-primary', 'قيد الشحن'],
+    delivered: ['bg-dark', 'تم التسليم'],
+    cancelled: ['bg-danger', 'ملغي']
+};
+
+App.setupLiveFeed = function() {
+    const url = document.body.dataset.liveFeed;
+    if (!url || !window.EventSource) {
+        return;
+    }
+    
+    let source = App.openLiveFeed(url);
+    
+    // Hidden tabs hand their stream, and the server thread behind it, back
+    // and catch up on what they missed once they are shown again
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'hidden') {
+            if (source) {
+                source.close();
+                source = null;
             }
-        }, interval);
+        } else if (!source) {
+            source = App.openLiveFeed(url);
+            App.refreshFragments();
+        }
     });
+    
+    window.addEventListener('pagehide', () => source && source.close());
+};
+
+App.openLiveFeed = function(url) {
+    const source = new EventSource(url);
+    
+    // Counter deltas are added to the figures already on the page
+    source.addEventListener('counters', event => {
+        const deltas = JSON.parse(event.data).deltas;
+        Object.keys(deltas).forEach(name => {
+            document.querySelectorAll(`[data-counter="${name}"]`).forEach(element => {
+                const current = parseFloat(element.textContent.replace(/[^\d.-]/g, '')) || 0;
+                element.textContent = Number((current + deltas[name]).toFixed(2));
+            });
+        });
+    });
+    
+    source.addEventListener('order_created', event => {
+        const order = JSON.parse(event.data);
+        App.showAlert(`طلب جديد #${order.id} من ${order.customer_name}`, 'info');
+        App.refreshFragments('orders');
+    });
+    
+    source.addEventListener('order_status', event => {
+        const order = JSON.parse(event.data);
+        const label = App.orderStatusLabels[order.status] || ['bg-secondary', order.status];
+        document.querySelectorAll(`[data-order-status="${order.id}"]`).forEach(element => {
+            const badge = document.createElement('span');
+            badge.className = `badge ${label[0]}`;
+            badge.textContent = label[1];
+            element.replaceChildren(badge);
+        });
+    });
+    
+    // Sent when this tab missed events, so its fragments are fetched again
+    source.addEventListener('resync', () => {
+        if (document.visibilityState === 'visible') {
+            App.refreshFragments();
+        }
+    });
+    
+    return source;
 };
 
 // Keyboard shortcuts
@@ -0,0 +1,100 @@
+"""
+Dashboard statistics for BaytAlSudani Admin Dashboard
+Reads every dashboard figure from the incrementally maintained counters
+"""
+from dataclasses import dataclass, field, asdict
+from decimal import Decimal
+from typing import Dict
+from counters import get_counters, GLOBAL_SCOPE
+
+ORDER_STATUSES = ('pending', 'confirmed', 'shipping', 'delivered', 'cancelled')
+
+@dataclass
+class OrderStats:
+    """Order counts per status plus delivered revenue"""
+    by_status: Dict[str, int] = field(default_factory=lambda: {status: 0 for status in ORDER_STATUSES})
+    total_revenue: Decimal = Decimal('0')
+
+    @property
+    def total(self):
+        """Total number of orders across all statuses"""
+        return sum(self.by_status.values())
+
+@dataclass
+class DashboardStats:
+    """Platform-wide statistics shown on the admin dashboard"""
+    total_merchants: int = 0
+    total_admins: int = 0
+    total_stores: int = 0
+    active_stores: int = 0
+    total_products: int = 0
+    total_services: int = 0
+    total_ads: int = 0
+    total_jobs: int = 0
+    orders: OrderStats = field(default_factory=OrderStats)
+
+    def to_dict(self):
+        """Convert to the flat dictionary used by templates and the local API"""
+        data = asdict(self)
+        data.pop('orders')
+        data.update({
+            # Earlier name of total_merchants, kept for API consumers
+            'total_users': self.total_merchants,
+            'total_orders': self.orders.total,
+            'pending_orders': self.orders.by_status.get('pending', 0),
+            'total_revenue': self.orders.total_revenue,
+            'orders_by_status': dict(self.orders.by_status),
+        })
+        return data
+
+@dataclass
+class MerchantStats:
+    """Statistics shown on a merchant dashboard"""
+    products_count: int = 0
+    services_count: int = 0
+    orders: OrderStats = field(default_factory=OrderStats)
+
+    def to_dict(self):
+        """Convert to the flat dictionary used by templates"""
+        return {
+            'products_count': self.products_count,
+            'services_count': self.services_count,
+            'orders_count': self.orders.total,
+            'pending_orders': self.orders.by_status.get('pending', 0),
+            'total_revenue': self.orders.total_revenue,
+            'orders_by_status': dict(self.orders.by_status),
+        }
+
+def _int(counters, name):
+    return int(counters.get(name, 0))
+
+def _order_stats(counters):
+    """Order counts per status and delivered revenue from a counter scope"""
+    return OrderStats(
+        by_status={status: _int(counters, f'orders_{status}') for status in ORDER_STATUSES},
+        total_revenue=Decimal(counters.get('revenue', 0))
+    )
+
+def get_dashboard_stats():
+    """Admin dashboard statistics read from the global counters"""
+    counters = get_counters(GLOBAL_SCOPE)
+    return DashboardStats(
+        total_merchants=_int(counters, 'merchants'),
+        total_admins=_int(counters, 'admins'),
+        total_stores=_int(counters, 'stores'),
+        active_stores=_int(counters, 'active_stores'),
+        total_products=_int(counters, 'products'),
+        total_services=_int(counters, 'services'),
+        total_ads=_int(counters, 'ads'),
+        total_jobs=_int(counters, 'jobs'),
+        orders=_order_stats(counters)
+    )
+
+def get_merchant_stats(merchant_id):
+    """Merchant dashboard statistics read from the merchant's counters"""
+    counters = get_counters(merchant_id)
+    return MerchantStats(
+        products_count=_int(counters, 'products'),
+        services_count=_int(counters, 'services'),
+        orders=_order_stats(counters)
+    )
@@ -0,0 +1,168 @@
+"""
+Background task runner for BaytAlSudani Admin Dashboard
+Tasks are rows in background_tasks claimed with FOR UPDATE SKIP LOCKED,
+so any number of in-process worker threads or sidecar processes can
+share the queue safely
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_
+from models import db, BackgroundTask
+import cascades
+import counters
+import rollups
+
+TASKS = {}
+
+_workers = []
+_workers_lock = threading.Lock()
+
+def task(name):
+    """Register a function as a background task handler"""
+    def decorator(f):
+        TASKS[name] = f
+        return f
+    return decorator
+
+def enqueue(name, payload=None, max_attempts=None, delay=0):
+    """Queue a task; it runs once the caller's transaction commits"""
+    if name not in TASKS:
+        raise ValueError(f"Unknown background task: {name}")
+    queued = BackgroundTask(
+        name=name,
+        payload=payload or {},
+        status='queued',
+        max_attempts=max_attempts or current_app.config.get('TASK_MAX_ATTEMPTS', 3),
+        run_after=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    db.session.add(queued)
+    return queued
+
+def refresh_rollups_if_stale():
+    """Queue a rollup refresh when the rollups are stale and none is queued or running yet"""
+    try:
+        if not rollups.is_stale():
+            return
+        pending = BackgroundTask.query.filter(
+            BackgroundTask.name == 'refresh_rollups',
+            BackgroundTask.status.in_(('queued', 'running'))
+        ).first()
+        if pending is None:
+            enqueue('refresh_rollups')
+            db.session.commit()
+    except Exception as e:
+        # The page still shows the rollups as they are
+        db.session.rollback()
+        logging.error(f"Rollup refresh queueing error: {e}")
+
+def claim_next_task():
+    """Lock and mark the next runnable task as running"""
+    now = datetime.utcnow()
+    # Tasks left running by a crashed worker become claimable again
+    stale = now - timedelta(seconds=current_app.config.get('TASK_VISIBILITY_TIMEOUT', 900))
+    claimed = BackgroundTask.query.filter(or_(
+        and_(BackgroundTask.status == 'queued', BackgroundTask.run_after <= now),
+        and_(BackgroundTask.status == 'running', BackgroundTask.started_at < stale)
+    )).order_by(BackgroundTask.id).with_for_update(skip_locked=True).first()
+
+    if claimed is None:
+        db.session.rollback()
+        return None
+
+    claimed.status = 'running'
+    claimed.attempts += 1
+    claimed.started_at = now
+    claimed.error = None
+    db.session.commit()
+    return claimed.id
+
+def run_next_task():
+    """Run one task if any is runnable; returns whether one ran"""
+    task_id = claim_next_task()
+    if task_id is None:
+        return False
+
+    claimed = db.session.get(BackgroundTask, task_id)
+    try:
+        result = TASKS[claimed.name](**(claimed.payload or {}))
+        # The handler's writes and the success mark commit together
+        claimed.status = 'succeeded'
+        claimed.result = result
+        claimed.finished_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Background task {task_id} ({claimed.name}) failed: {e}")
+        claimed = db.session.get(BackgroundTask, task_id)
+        claimed.error = str(e)
+        if claimed.attempts < claimed.max_attempts:
+            backoff = current_app.config.get('TASK_RETRY_BACKOFF', 30) * 2 ** (claimed.attempts - 1)
+            claimed.status = 'queued'
+            claimed.run_after = datetime.utcnow() + timedelta(seconds=backoff)
+        else:
+            claimed.status = 'failed'
+            claimed.finished_at = datetime.utcnow()
+        db.session.commit()
+    return True
+
+class TaskWorker(threading.Thread):
+    """Worker thread polling the task queue"""
+
+    def __init__(self, app, index=0):
+        super().__init__(name=f'task-worker-{index}', daemon=True)
+        self.app = app
+        self.stopping = threading.Event()
+
+    def run(self):
+        poll_interval = self.app.config.get('TASK_POLL_INTERVAL', 2)
+        while not self.stopping.is_set():
+            with self.app.app_context():
+                try:
+                    ran = run_next_task()
+                except Exception as e:
+                    logging.error(f"Background task worker error: {e}")
+                    ran = False
+                finally:
+                    db.session.remove()
+            if not ran:
+                self.stopping.wait(poll_interval)
+
+    def stop(self):
+        self.stopping.set()
+
+def start_workers(app, count=None):
+    """Start the worker pool for this process once"""
+    count = app.config.get('TASK_WORKERS', 1) if count is None else count
+    with _workers_lock:
+        if _workers:
+            return _workers
+        for index in range(count):
+            worker = TaskWorker(app, index)
+            worker.start()
+            _workers.append(worker)
+    return _workers
+
+# ==================== TASK HANDLERS ====================
+
+@task('delete_merchant')
+def delete_merchant_task(user_id):
+    return cascades.delete_merchant(user_id)
+
+@task('delete_store')
+def delete_store_task(store_id):
+    return cascades.delete_store(store_id)
+
+@task('delete_product')
+def delete_product_task(product_id):
+    return cascades.delete_product(product_id)
+
+@task('rebuild_counters')
+def rebuild_counters_task():
+    return {'counters': counters.rebuild_counters()}
+
+@task('refresh_rollups')
+def refresh_rollups_task(full=False):
+    days = rollups.refresh_rollups(full=full)
+    return {'days': None if days is None else len(days)}